@@ -1,10 +1,140 @@
 from collections import deque
-from copy import deepcopy
+from functools import lru_cache
 import random
 import math
-from tqdm import tqdm
+import time
+import numpy as np
 
 from amazons.game import *
+from amazons import endgame
+from amazons import processes
+
+
+@lru_cache(maxsize=None)
+def _numpy_layout(size):
+    """Padded flat layout used by the NumPy evaluation.
+
+    Square (y, x) sits at index (y+1)*(size+1) + x, surrounded by a padding row
+    on top and bottom and a padding column on the right, so a shifted ray can
+    never leave the array or wrap into another row without hitting padding.
+    Returns the board cells in row-major order and, for each of the eight
+    directions, the index every cell pulls its value from when stepping once.
+    """
+    width = size + 1
+    length = (size + 2) * width
+    cells = np.array([(y+1)*width + x for y in range(size) for x in range(size)])
+    offsets = np.array([dy*width + dx for dy, dx in DIRECTIONS])
+    source = np.clip(np.arange(length)[None, :] - offsets[:, None], 0, length - 1)
+    gather = (source + np.arange(len(DIRECTIONS))[:, None] * length).ravel()
+    return length, cells, gather
+
+
+def queen_distances(codes, size):
+    """Queen-move distances of both colours for a stack of boards.
+
+    codes is an integer array of shape (batch, size*size) holding Piece values
+    in row-major order. Returns an array of shape (batch, 2, size*size) with the
+    white and black distances, -1 where a square can't be reached.
+    """
+    length, cells, gather = _numpy_layout(size)
+    batch = codes.shape[0]
+    directions = len(DIRECTIONS)
+
+    # squares come first and boards last, so stepping a ray copies whole rows
+    codes = codes.T
+    empty = np.zeros((length, 1, batch), dtype=bool)
+    empty[cells, 0] = codes == Piece.nothing.value
+    empty = np.tile(empty, (directions, 1, 1))
+    frontier = np.zeros((length, 2, batch), dtype=bool)
+    frontier[cells, 0] = codes == Piece.white_amazon.value
+    frontier[cells, 1] = codes == Piece.black_amazon.value
+
+    visited = frontier.copy()
+    distances = np.where(frontier, 0, -1)
+    level = 0
+    while frontier.any():
+        level += 1
+        # slides every frontier square along all eight directions at once
+        ray = np.tile(frontier, (directions, 1, 1))
+        reached = np.zeros_like(frontier)
+        while True:
+            ray = ray[gather]
+            ray &= empty
+            if not ray.any():
+                break
+            reached |= ray.reshape(directions, length, 2, batch).any(axis=0)
+        frontier = reached & ~visited
+        visited |= frontier
+        distances[frontier] = level
+
+    return distances[cells].transpose(2, 1, 0)
+
+
+def other_color(piece):
+    if piece == Piece.white_amazon:
+        return Piece.black_amazon
+    else:
+        return Piece.white_amazon
+
+
+def _deep_follow_up(data, own, divider, seed):
+    """Best reply evaluation of own on a packed board (None if own can't move) and the SearchStats"""
+    random.seed(seed)
+    agent = processes.worker['agent']
+    agent.stats = SearchStats()
+    follow_ups = agent.search_move(unpack_board(data), own, divider, 1, 0)
+    if len(follow_ups) < 1:
+        return None, agent.stats
+    return follow_ups[0][1], agent.stats
+
+
+def _alpha_root_move(data, own, move, depth, beta, deadline):
+    """Searches one root move of a packed board against the shared alpha.
+
+    Returns the score and whether it is exact (above the alpha it was searched
+    with), or None when the deadline passed, together with the SearchStats.
+    """
+    agent, shared_alpha = processes.worker['agent'], processes.worker['alpha']
+    board = unpack_board(data)
+    apply(board, move)
+    agent.mobility = Mobility(board)
+    agent.stats = SearchStats()
+    agent.iteration = depth
+    # ties with the best move have to come back exact so the merge can order them
+    alpha = shared_alpha.value - AlphaTerror.TIE_MARGIN
+    try:
+        score = -agent.negamax(board, other_color(own), depth - 1, -beta, -alpha, deadline)
+    except _SearchTimeout:
+        return None, agent.stats
+    with shared_alpha.get_lock():
+        if score > shared_alpha.value:
+            shared_alpha.value = score
+    return (score, score > alpha), agent.stats
+
+
+def _monte_playouts(leaves, seed):
+    agent = processes.worker['agent']
+    agent.stats = SearchStats()
+    return agent.playouts(leaves, seed), agent.stats
+
+
+def progress_bar(**kwargs):
+    """A progress hook for Terror.progress that draws tqdm bars, one per search"""
+    from tqdm import tqdm
+    bar = None
+
+    def hook(done, total):
+        nonlocal bar
+        if bar is None or bar.total != total or done < bar.n:
+            if bar is not None:
+                bar.close()
+            bar = tqdm(total=total, **kwargs)
+        bar.update(done - bar.n)
+        if done >= total:
+            bar.close()
+            bar = None
+
+    return hook
 
 
 class Random(Agent):
@@ -12,66 +142,223 @@ class Random(Agent):
 
 
 class Terror(Agent):
+    # separated positions whose owned regions have at most this many empty squares are solved exactly
+    endgame_limit = 16
 
-    def __init__(self, name, distance_eval, unreachable_value):
+    def __init__(self, name, distance_eval, unreachable_value, backend='numpy', table=None):
         super().__init__(name)
         self.distance_eval = distance_eval
         self.unreachable_value = unreachable_value
+        # 'python' walks the board with a BFS, 'numpy' propagates rays over arrays,
+        # 'incremental' patches the distance maps of a parent position per move
+        self.backend = backend
+        self._lookups = {}
+        # optional TranspositionTable consulted by the deep searches
+        self.table = table
+        # called with (done, total) as the root moves are searched, see progress_bar
+        self.progress = None
+        # processes used for root-parallel search, 1 searches in this process
+        self.workers = 1
+        self._pool = None
+        self._alpha = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_pool'] = None
+        state['_alpha'] = None
+        return state
+
+    def known_move(self, board, own):
+        """Adds solved endgames to the book moves, valued as own's moves left minus the opponent's"""
+        known = super().known_move(board, own)
+        if known is not None or self.endgame_limit < 1:
+            return known
+        solved = endgame.solve(board, own, self.endgame_limit)
+        if solved is None or solved[0] is None:
+            return None
+        move, own_moves, other_moves = solved
+        return move, own_moves - other_moves
+
+    def process_pool(self):
+        """Lazily starts the worker processes, each holding a copy of this agent.
+
+        Workers are forked where possible, so the agent may hold lambdas. Where
+        processes are spawned the agent has to be picklable, which means using
+        module-level functions for distance_eval and r_cutoff.
+        """
+        if self._pool is None:
+            self._alpha = processes.context().Value('d', -math.inf)
+            self._pool = processes.pool(self.workers, agent=self, alpha=self._alpha)
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
 
     def neighbors(self, board, pos):
         y, x = pos
         possible_movement = []
-        for i in range(-1, 2):
-            for j in range(-1, 2):
-                if i == 0 and j == 0:
-                    continue
-                k = 1
-                while True:
-                    if y+i*k < 0 or x+j*k < 0:
-                        break
-                    if y+i*k >= len(board) or x+j*k >= len(board):
-                        break
-                    if board[y+i*k][x+j*k] == Piece.nothing:
-                        possible_movement.append((y+i*k, x+j*k))
-                    else:
-                        break
-                    k += 1
+        for ray in ray_table(len(board))[y][x]:
+            for square in ray:
+                if board[square[0]][square[1]] != Piece.nothing:
+                    break
+                possible_movement.append(square)
 
         return possible_movement
 
     def evaluate(self, board, own):
+        if self.backend == 'numpy':
+            return self.evaluate_numpy(board, own)
+        return self.evaluate_python(board, own)
+
+    def distance_lookup(self, size):
+        """Values of distance_eval for every reachable distance, unreachable_value at index -1"""
+        if size not in self._lookups:
+            values = [self.distance_eval(max(1, dist)) for dist in range(size*size)]
+            values.append(self.unreachable_value)
+            self._lookups[size] = np.array(values, dtype=float)
+        return self._lookups[size]
+
+    def evaluate_numpy(self, board, own):
+        return float(self.evaluate_many([board], own)[0])
+
+    def evaluate_many(self, boards, own, moves=None):
+        """Evaluates many positions at once and returns their scores as an array.
+
+        Either boards is a list of boards (or an array of Piece values of shape
+        (batch, size, size)), or boards is a single parent board and moves a list
+        of queen moves or full moves played on it. The NumPy backend scores the
+        whole stack in one vectorized pass, the Python backend one at a time.
+        """
+        if moves is not None and len(moves) == 0:
+            return np.zeros(0)
+        self.stats.evaluations += len(boards) if moves is None else len(moves)
+        self.stats.evaluate_calls += 1
+        start = time.perf_counter()
+        try:
+            return self._evaluate_many(boards, own, moves)
+        finally:
+            self.stats.evaluation_seconds += time.perf_counter() - start
+
+    def _evaluate_many(self, boards, own, moves):
+        if self.backend == 'incremental' and moves is not None:
+            return self.evaluate_incremental(boards, own, moves)
+
+        if self.backend != 'numpy':
+            if moves is None:
+                return np.array([self.evaluate_python(board, own) for board in boards], dtype=float)
+            scores = []
+            for move in moves:
+                record = apply(boards, move)
+                scores.append(self.evaluate_python(boards, own))
+                undo(boards, record)
+            return np.array(scores, dtype=float)
+
+        if moves is None:
+            if isinstance(boards, np.ndarray):
+                size = boards.shape[1]
+                codes = boards.reshape(len(boards), -1)
+            else:
+                size = len(boards[0])
+                codes = np.array([[piece.value for row in board for piece in row] for board in boards])
+        else:
+            size = len(boards)
+            parent = np.array([piece.value for row in boards for piece in row])
+            codes = np.tile(parent, (len(moves), 1))
+            index = np.arange(len(moves))
+            move_from = np.array([y*size + x for (y, x), *_ in moves])
+            move_to = np.array([y*size + x for _, (y, x), *_ in moves])
+            codes[index, move_from] = Piece.nothing.value
+            codes[index, move_to] = parent[move_from]
+            if len(moves[0]) == 3:
+                codes[index, [y*size + x for _, _, (y, x) in moves]] = Piece.arrow.value
+
+        distances = queen_distances(codes, size)
+
+        lookup = self.distance_lookup(size)
+        values = lookup[distances]
+        values[:, 1] *= -1
+
+        # sums cell by cell, white before black, in the same order as evaluate_python
+        # so both backends round identically
+        evaluation = np.cumsum(values.transpose(0, 2, 1).reshape(len(codes), -1), axis=1)[:, -1]
+
+        if own == Piece.white_amazon:
+            return evaluation
+        else:
+            return -evaluation
+
+    def evaluate_incremental(self, board, own, moves):
+        """Scores moves played on board by updating one IncrementalEvaluator.
+
+        Consecutive full moves sharing a queen move only play that queen move once,
+        so each arrow costs a partial update of both distance maps.
+        """
+        evaluator = IncrementalEvaluator(self, board)
+        scores = []
+        queen = None
+        for move in moves:
+            if len(move) == 2:
+                evaluator.apply(move)
+                scores.append(evaluator.value(own))
+                evaluator.undo()
+                continue
+
+            if move[:2] != queen:
+                if queen is not None:
+                    evaluator.undo()
+                queen = move[:2]
+                evaluator.apply(queen)
+            evaluator.apply_arrow(move[1:])
+            scores.append(evaluator.value(own))
+            evaluator.undo()
+
+        if queen is not None:
+            evaluator.undo()
+        return np.array(scores, dtype=float)
+
+    def evaluate_python(self, board, own):
+        size = len(board)
+        rays = ray_table(size)
+
         pieces = {}
         pieces[Piece.white_amazon] = []
         pieces[Piece.black_amazon] = []
 
-        for y in range(len(board)):
-            for x in range(len(board[0])):
+        for y in range(size):
+            for x in range(size):
                 if board[y][x] in [Piece.white_amazon, Piece.black_amazon]:
                     pieces[board[y][x]].append((y, x))
 
         distances = {}
-        distances[Piece.white_amazon] = [[-1 for x in range(len(board[0]))] for y in range(len(board))]
-        distances[Piece.black_amazon] = [[-1 for x in range(len(board[0]))] for y in range(len(board))]
+        distances[Piece.white_amazon] = [[-1 for x in range(size)] for y in range(size)]
+        distances[Piece.black_amazon] = [[-1 for x in range(size)] for y in range(size)]
 
         for color in [Piece.white_amazon, Piece.black_amazon]:
+            color_distances = distances[color]
             queue = deque()
             for piece in pieces[color]:
                 y, x = piece
                 queue.append((y, x, 0))
-                distances[color][y][x] = 0
+                color_distances[y][x] = 0
 
             while len(queue) > 0:
                 y, x, dist = queue.popleft()
 
-                for new_y, new_x in self.neighbors(board, (y, x)):
-                    if distances[color][new_y][new_x] != -1:
-                        continue
-                    distances[color][new_y][new_x] = dist+1
-                    queue.append((new_y, new_x, dist+1))
+                # walks the queen rays directly instead of building the neighbors list
+                for ray in rays[y][x]:
+                    for new_y, new_x in ray:
+                        if board[new_y][new_x] != Piece.nothing:
+                            break
+                        if color_distances[new_y][new_x] != -1:
+                            continue
+                        color_distances[new_y][new_x] = dist+1
+                        queue.append((new_y, new_x, dist+1))
 
         evaluation = 0
-        for y in range(len(board)):
-            for x in range(len(board[0])):
+        for y in range(size):
+            for x in range(size):
                 for sign, piece in [(1, Piece.white_amazon), (-1, Piece.black_amazon)]:
                     dist = distances[piece][y][x]
                     if dist == -1:
@@ -87,7 +374,36 @@ class Terror(Agent):
             return -evaluation
 
 
-    def select_move(self, board, own):
+    def search_table(self, board, own, depth, context, expand):
+        """Returns the best (move, evaluation) from the transposition table, or runs expand()
+
+        Without a table this is just expand(). Otherwise an entry searched at least
+        as deep with the same context is reused, and the best result of expand()
+        is stored for the positions that transpose into this one.
+        """
+        if self.table is None:
+            return expand()
+
+        key = zobrist_hash(board, own)
+        entry = self.table.lookup(key, depth, context)
+        self.stats.table_lookups += 1
+        if entry is not None:
+            self.stats.table_hits += 1
+            evaluation, move = entry
+            if move is None:
+                return []
+            return [(move, evaluation)]
+
+        moves = expand()
+        if len(moves) < 1:
+            self.table.store(key, depth, None, None, context)
+        else:
+            self.table.store(key, depth, moves[0][1], moves[0][0], context)
+        return moves
+
+    def score_queen_moves(self, board, own):
+        """Every queen move of own with the evaluation after it, best first"""
+        start = time.perf_counter()
         pieces = []
         for y in range(len(board)):
             for x in range(len(board[0])):
@@ -95,42 +411,98 @@ class Terror(Agent):
                     pieces.append((y, x))
 
         queen_moves = []
-        for p in pieces:
-            y, x = p
+        for y, x in pieces:
             neigh = self.neighbors(board, (y, x))
 
             random.shuffle(neigh)
-            for move_y, move_x in tqdm(neigh):
-                tmp_board = deepcopy(board)
-                tmp_board = queen_move(tmp_board, ((y, x), (move_y, move_x)))
-                if tmp_board is None:
-                    continue
-
-                queen_moves.append((
-                    ((y, x), (move_y, move_x)),
-                    self.evaluate(tmp_board, own)
-                ))
+            for move_y, move_x in neigh:
+                queen_moves.append(((y, x), (move_y, move_x)))
+        self.stats.generation_seconds += time.perf_counter() - start
 
+        scores = self.evaluate_many(board, own, queen_moves).tolist()
+        queen_moves = list(zip(queen_moves, scores))
         queen_moves.sort(key=lambda x: x[1], reverse=True)
-        queen_moves = queen_moves[:]
+        return queen_moves
+
+    def arrow_moves(self, board, own, queen_moves, progress=False):
+        """Every full move after the given scored queen moves, with the evaluation of its queen move.
+
+        With progress the progress hook (if any) follows the queen moves.
+        """
+        start = time.perf_counter()
+        hook = self.progress if progress else None
 
         moves = []
-        for ((y, x), (move_y, move_x)), evaluation in tqdm(queen_moves):
-            tmp_board = deepcopy(board)
-            tmp_board = queen_move(tmp_board, ((y, x), (move_y, move_x)))
-            neigh_arrow = self.neighbors(tmp_board, (move_y, move_x))
+        for i, (((y, x), (move_y, move_x)), evaluation) in enumerate(queen_moves):
+            queen_record = apply(board, ((y, x), (move_y, move_x)))
+            neigh_arrow = self.neighbors(board, (move_y, move_x))
+            undo(board, queen_record)
+
             random.shuffle(neigh_arrow)
-            for arrow_y, arrow_x in neigh_arrow[:]:
-                tmp_arrow_board = deepcopy(tmp_board)
-                tmp_arrow_board = arrow_move(tmp_arrow_board, ((move_y, move_x), (arrow_y, arrow_x)))
-                if tmp_arrow_board is None:
-                    continue
-                moves.append((
-                    ((y, x), (move_y, move_x), (arrow_y, arrow_x)),
-                    self.evaluate(tmp_arrow_board, own)
-                    ))
+            for arrow_y, arrow_x in neigh_arrow:
+                moves.append((((y, x), (move_y, move_x), (arrow_y, arrow_x)), evaluation))
+            if hook is not None:
+                hook(i + 1, len(queen_moves))
+        self.stats.generation_seconds += time.perf_counter() - start
+        return moves
 
+    def score_arrow_moves(self, board, own, queen_moves, progress=False):
+        """Every arrow after the given scored queen moves with the evaluation after it, best first"""
+        moves = [move for move, _ in self.arrow_moves(board, own, queen_moves, progress)]
+        scores = self.evaluate_many(board, own, moves).tolist()
+        moves = list(zip(moves, scores))
         moves.sort(key=lambda x: x[1], reverse=True)
+        return moves
+
+    def candidates(self, board, own):
+        """Full moves worth searching with their evaluation, best first.
+
+        Keeps the move_cutoff best queen moves and, after them, arrow_cutoff
+        arrows per kept queen move, so agents that search with it set both.
+        """
+        queen_moves = self.score_queen_moves(board, own)[:self.move_cutoff]
+        moves = self.score_arrow_moves(board, own, queen_moves)
+        return moves[:len(queen_moves)*self.arrow_cutoff]
+
+    def staged_arrow_moves(self, board, own, queen_moves, first=(), history=None, batch=32):
+        """Yields the arrows after the given scored queen moves in evaluated batches.
+
+        The moves are generated like in score_arrow_moves, but evaluated lazily,
+        in an order that only costs bit operations: the moves in first (killer
+        moves), then by history score, then arrows that take a square away from
+        the opponent, then by the evaluation of the queen move. Batches double in
+        size, so a caller that stops early saves most of the evaluations.
+        """
+        moves = self.arrow_moves(board, own, queen_moves)
+        ordering = time.perf_counter()
+        position = BitBoard.from_board(board)
+        opponent_reach = position.reach(other_color(own))
+        first = set(first)
+        if history is None:
+            history = {}
+
+        def order(scored):
+            move, queen_evaluation = scored
+            return (move in first, history.get(move, 0),
+                    bool(position.bit(*move[2]) & opponent_reach), queen_evaluation)
+
+        moves.sort(key=order, reverse=True)
+        moves = [move for move, _ in moves]
+        self.stats.generation_seconds += time.perf_counter() - ordering
+        start = 0
+        while start < len(moves):
+            chunk = moves[start:start + batch]
+            yield list(zip(chunk, self.evaluate_many(board, own, chunk).tolist()))
+            start += batch
+            batch *= 2
+
+    def select_move(self, board, own):
+        known = self.known_move(board, own)
+        if known is not None:
+            return known
+        self.stats.expanded(0)
+        queen_moves = self.score_queen_moves(board, own)
+        moves = self.score_arrow_moves(board, own, queen_moves, progress=True)
 
         if len(moves) < 1:
             return super().select_move(board, own)
@@ -138,82 +510,264 @@ class Terror(Agent):
         return moves[0]
 
 
+class IncrementalEvaluator:
+    """Queen-distance maps and evaluation of one position, updated move by move.
+
+    The evaluator plays moves on the board it was given. After a move only the
+    distance levels the changed squares can influence are searched again; all
+    squares closer to the amazons keep their distance. Scores equal
+    Terror.evaluate up to floating point rounding.
+    """
+
+    def __init__(self, agent, board, max_region=0.5):
+        self.board = board
+        self.size = len(board)
+        self.rays = ray_table(self.size)
+        self.lookup = agent.distance_lookup(self.size).tolist()
+        # share of the board above which a map is rebuilt instead of patched
+        self.max_region = max_region
+        self.history = []
+
+        self.distances = {}
+        for color in [Piece.white_amazon, Piece.black_amazon]:
+            self.distances[color] = self._rebuild(color)
+
+        self.evaluation = 0
+        for y in range(self.size):
+            for x in range(self.size):
+                for sign, color in [(1, Piece.white_amazon), (-1, Piece.black_amazon)]:
+                    self.evaluation += sign * self.lookup[self.distances[color][y][x]]
+
+    def value(self, own):
+        if own == Piece.white_amazon:
+            return self.evaluation
+        else:
+            return -self.evaluation
+
+    def apply(self, move):
+        """Plays a queen move or full move like game.apply and updates the distances"""
+        before = {square: self.board[square[0]][square[1]] for square in move}
+        record = apply(self.board, move)
+        if record is not None:
+            self._update(record, before)
+        return record
+
+    def apply_arrow(self, move):
+        """Shoots an arrow like game.apply_arrow and updates the distances"""
+        y, x = move[1]
+        before = {(y, x): self.board[y][x]}
+        record = apply_arrow(self.board, move)
+        if record is not None:
+            self._update(record, before)
+        return record
+
+    def undo(self):
+        """Takes back the last move, restoring the saved distances"""
+        record, self.evaluation, self.distances = self.history.pop()
+        undo(self.board, record)
+
+    def _search(self, distances, queue):
+        board = self.board
+        rays = self.rays
+        while len(queue) > 0:
+            y, x, dist = queue.popleft()
+            for ray in rays[y][x]:
+                for new_y, new_x in ray:
+                    if board[new_y][new_x] != Piece.nothing:
+                        break
+                    if distances[new_y][new_x] != -1:
+                        continue
+                    distances[new_y][new_x] = dist+1
+                    queue.append((new_y, new_x, dist+1))
+        return distances
+
+    def _rebuild(self, color):
+        distances = [[-1 for x in range(self.size)] for y in range(self.size)]
+        queue = deque()
+        for y in range(self.size):
+            for x in range(self.size):
+                if self.board[y][x] == color:
+                    distances[y][x] = 0
+                    queue.append((y, x, 0))
+        return self._search(distances, queue)
+
+    def _first_changed_level(self, color, before, distances):
+        """Lowest distance level the changed squares can influence, None if they can't.
+
+        Levels below it are guaranteed to be identical before and after the move.
+        A square that gets blocked only matters from its own distance onwards, a
+        square that gets freed from one more than the closest square it can see.
+        """
+        board = self.board
+        first = None
+        for (y, x), was in before.items():
+            now = board[y][x]
+            if was == color or now == color:
+                return 0
+            if (was == Piece.nothing) == (now == Piece.nothing):
+                continue
+
+            if was == Piece.nothing:
+                level = distances[y][x]
+                if level == -1:
+                    continue
+            else:
+                level = None
+                for ray in self.rays[y][x]:
+                    for new_y, new_x in ray:
+                        dist = distances[new_y][new_x]
+                        if dist != -1 and (level is None or dist+1 < level):
+                            level = dist+1
+                        # walks on as long as the square is empty before or after the move
+                        if board[new_y][new_x] != Piece.nothing and before.get((new_y, new_x), board[new_y][new_x]) != Piece.nothing:
+                            break
+                if level is None:
+                    continue
+
+            if first is None or level < first:
+                first = level
+        return first
+
+    def _update(self, record, before):
+        self.history.append((record, self.evaluation, self.distances))
+        self.distances = dict(self.distances)
+
+        for sign, color in [(1, Piece.white_amazon), (-1, Piece.black_amazon)]:
+            old = self.distances[color]
+            first = self._first_changed_level(color, before, old)
+            if first is None:
+                continue
+
+            region = []
+            queue = deque()
+            if first > 1:
+                new = [row[:] for row in old]
+                # forgets every level from first on and restarts the BFS from the level below
+                for y in range(self.size):
+                    for x in range(self.size):
+                        dist = old[y][x]
+                        if dist == -1 or dist >= first:
+                            region.append((y, x))
+                            new[y][x] = -1
+                        elif dist == first - 1:
+                            queue.append((y, x, dist))
+
+            if first <= 1 or len(region) > self.max_region * self.size * self.size:
+                new = self._rebuild(color)
+                region = [(y, x) for y in range(self.size) for x in range(self.size)]
+            else:
+                self._search(new, queue)
+
+            for y, x in region:
+                if new[y][x] != old[y][x]:
+                    self.evaluation += sign * (self.lookup[new[y][x]] - self.lookup[old[y][x]])
+            self.distances[color] = new
+
+
+class TranspositionTable:
+    """Bounded table of search results keyed by Zobrist hash.
+
+    Every bucket has two slots. The first is depth-preferred: it only gives way
+    to an equally deep search or to an entry left over from an earlier move
+    (aging). The second always takes the newest entry that didn't fit the first.
+    """
+
+    # rough size of one entry including its move tuples, used to turn the memory cap into slots
+    ENTRY_BYTES = 320
+
+    def __init__(self, max_bytes=64 * 2**20):
+        self.buckets = max(1, max_bytes // (2 * self.ENTRY_BYTES))
+        self.slots = [None] * (2 * self.buckets)
+        self.age = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def __str__(self):
+        return f"TranspositionTable {self.hits} hits, {self.misses} misses, {self.stores} stores"
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0
+
+    def new_search(self):
+        """Marks the entries stored so far as old so deeper ones can be replaced"""
+        self.age += 1
+
+    def clear(self):
+        self.slots = [None] * (2 * self.buckets)
+        self.hits = self.misses = self.stores = 0
+
+    def lookup(self, key, depth, context=None):
+        """Returns (evaluation, move) of an entry searched at least depth deep, or None"""
+        i = 2 * (key % self.buckets)
+        for entry in (self.slots[i], self.slots[i+1]):
+            if entry is not None and entry[0] == key and entry[1] >= depth and entry[2] == context:
+                self.hits += 1
+                return entry[3], entry[4]
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, evaluation, move, context=None):
+        i = 2 * (key % self.buckets)
+        entry = (key, depth, context, evaluation, move, self.age)
+        preferred = self.slots[i]
+        if preferred is None or depth >= preferred[1] or preferred[5] != self.age:
+            self.slots[i] = entry
+        else:
+            self.slots[i+1] = entry
+        self.stores += 1
+
+
 class DeepTerror(Terror):
 
-    def __init__(self, name, distance_eval, unreachable_value, move_cutoff, arrow_cutoff, deep_divider, responsiveness):
-        super().__init__(name, distance_eval, unreachable_value)
+    def __init__(self, name, distance_eval, unreachable_value, move_cutoff, arrow_cutoff, deep_divider, responsiveness, backend='numpy', table=None, workers=1):
+        super().__init__(name, distance_eval, unreachable_value, backend, table)
         self.move_cutoff = move_cutoff
         self.arrow_cutoff = arrow_cutoff
         self.deep_divider = deep_divider
         self.responsiveness = responsiveness
+        self.workers = workers
 
     def select_move(self, board, own):
+        known = self.known_move(board, own)
+        if known is not None:
+            return known
+        if self.table is not None:
+            self.table.new_search()
         move, evaluation = self.search_move(board, own, 1, 0, 0)[0]
         return move, evaluation
 
     def search_move(self, board, own, divider, r, max_recursion):
-        pieces = []
-        for y in range(len(board)):
-            for x in range(len(board[0])):
-                if board[y][x] == own:
-                    pieces.append((y, x))
-
-        queen_moves = []
-        for p in pieces:
-            y, x = p
-            neigh = self.neighbors(board, (y, x))
-
-            random.shuffle(neigh)
-            for move_y, move_x in neigh:
-                tmp_board = deepcopy(board)
-                tmp_board = queen_move(tmp_board, ((y, x), (move_y, move_x)))
-                if tmp_board is None:
-                    continue
-
-                queen_moves.append((
-                    ((y, x), (move_y, move_x)),
-                    self.evaluate(tmp_board, own)
-                ))
+        # a smaller divider keeps more candidates, so it counts as a deeper search
+        return self.search_table(board, own, -divider, None,
+                                 lambda: self.expand_move(board, own, divider, r, max_recursion))
 
-        queen_moves.sort(key=lambda x: x[1], reverse=True)
+    def expand_move(self, board, own, divider, r, max_recursion):
+        self.stats.expanded(r)
+        queen_moves = self.score_queen_moves(board, own)
         queen_moves = queen_moves[:self.move_cutoff//divider + 1]
 
-        moves = []
-        for ((y, x), (move_y, move_x)), evaluation in queen_moves:
-            tmp_board = deepcopy(board)
-            tmp_board = queen_move(tmp_board, ((y, x), (move_y, move_x)))
-            neigh_arrow = self.neighbors(tmp_board, (move_y, move_x))
-            random.shuffle(neigh_arrow)
-            for arrow_y, arrow_x in neigh_arrow[:]:
-                tmp_arrow_board = deepcopy(tmp_board)
-                tmp_arrow_board = arrow_move(tmp_arrow_board, ((move_y, move_x), (arrow_y, arrow_x)))
-                if tmp_arrow_board is None:
-                    continue
-                moves.append((
-                    ((y, x), (move_y, move_x), (arrow_y, arrow_x)),
-                    self.evaluate(tmp_arrow_board, own),
-                    tmp_arrow_board
-                    ))
-
-        moves.sort(key=lambda x: x[1], reverse=True)
+        moves = self.score_arrow_moves(board, own, queen_moves)
         moves = moves[:(len(queen_moves)*self.arrow_cutoff)//divider + 1]
         if len(moves) < 1:
             return []
         if len(moves) < 2:
             return [(moves[0][0], moves[0][1])]
 
-        if divider == 1:
-            moves = tqdm(moves)
+        if divider == 1 and self.workers > 1:
+            return self.expand_parallel(board, own, moves)
 
-        def other_color(piece):
-            if piece == Piece.white_amazon:
-                return Piece.black_amazon
-            else:
-                return Piece.white_amazon
+        progress = self.progress if divider == 1 else None
 
         deep_moves = []
-        for ((y, x), (move_y, move_x), (arrow_y, arrow_x)), evaluation, board in moves:
+        for i, (((y, x), (move_y, move_x), (arrow_y, arrow_x)), evaluation) in enumerate(moves):
+            record = apply(board, ((y, x), (move_y, move_x), (arrow_y, arrow_x)))
             follow_ups = self.search_move(board, other_color(own), divider*self.deep_divider, r+1, max_recursion)
+            undo(board, record)
+            if progress is not None:
+                progress(i + 1, len(moves))
             if len(follow_ups) < 1:
                 return [(((y, x), (move_y, move_x), (arrow_y, arrow_x)), 100000)]
 
@@ -226,16 +780,50 @@ class DeepTerror(Terror):
         deep_moves.sort(key=lambda x: x[1], reverse=True)
         return deep_moves
 
+    def expand_parallel(self, board, own, moves):
+        """Searches the replies to the root candidates in the process pool.
+
+        Every task gets a packed board and its own seed drawn here, so the result
+        only depends on the random state at the root and not on scheduling.
+        """
+        tasks = []
+        for move, evaluation in moves:
+            record = apply(board, move)
+            tasks.append((pack_board(board), random.getrandbits(64)))
+            undo(board, record)
+
+        pool = self.process_pool()
+        futures = [pool.submit(_deep_follow_up, data, other_color(own), self.deep_divider, seed) for data, seed in tasks]
+
+        deep_moves = []
+        for i, ((move, evaluation), future) in enumerate(zip(moves, futures)):
+            enemy_evaluation, stats = future.result()
+            self.stats.merge(stats)
+            if self.progress is not None:
+                self.progress(i + 1, len(moves))
+            if enemy_evaluation is None:
+                for rest in futures:
+                    rest.cancel()
+                return [(move, 100000)]
+
+            deep_moves.append((move, evaluation - self.responsiveness * enemy_evaluation))
+
+        deep_moves.sort(key=lambda x: x[1], reverse=True)
+        return deep_moves
+
 
 class FreeTerror(Terror):
 
-    def __init__(self, name, distance_eval, unreachable_value, responsiveness, r_cutoff, max_sample):
-        super().__init__(name, distance_eval, unreachable_value)
+    def __init__(self, name, distance_eval, unreachable_value, responsiveness, r_cutoff, max_sample, backend='numpy', table=None):
+        super().__init__(name, distance_eval, unreachable_value, backend, table)
         self.responsiveness = responsiveness
         self.r_cutoff = r_cutoff
         self.max_sample = max_sample
 
     def select_move(self, board, own):
+        known = self.known_move(board, own)
+        if known is not None:
+            return known
         pieces = []
         for y in range(len(board)):
             for x in range(len(board[0])):
@@ -248,73 +836,36 @@ class FreeTerror(Terror):
             l = len(neigh)
             possibility_space += l*l
 
+        # the deepest recursion whose estimated sample stays below max_sample
         max_recursion = 0
         cutoff = self.r_cutoff(possibility_space, max_recursion)
         x = cutoff*cutoff+1
-        print('x0', x)
         while x < self.max_sample and max_recursion < 5:
             max_recursion += 1
             cutoff = self.r_cutoff(possibility_space, max_recursion)
             x = (x)*(cutoff*cutoff+1)
-            print('x', x)
 
         max_recursion -= 1
 
-        print('max recursion', max_recursion)
-        
         self.iterations = 0
+        if self.table is not None:
+            self.table.new_search()
         move, evaluation = self.search_move(board, own, possibility_space, 0, max_recursion)[0]
         return move, evaluation
 
     def search_move(self, board, own, initial_possibility_space, r, max_recursion):
-        pieces = []
-        for y in range(len(board)):
-            for x in range(len(board[0])):
-                if board[y][x] == own:
-                    pieces.append((y, x))
-
-        queen_moves = []
-        for p in pieces:
-            y, x = p
-            neigh = self.neighbors(board, (y, x))
-
-            random.shuffle(neigh)
-            for move_y, move_x in neigh:
-                tmp_board = deepcopy(board)
-                tmp_board = queen_move(tmp_board, ((y, x), (move_y, move_x)))
-                if tmp_board is None:
-                    continue
-
-                queen_moves.append((
-                    ((y, x), (move_y, move_x)),
-                    self.evaluate(tmp_board, own)
-                ))
+        # results are only shared between nodes searched with the same widths, the
+        # width of this and every deeper ply follows from the possibility space and r
+        return self.search_table(board, own, max_recursion - r, (initial_possibility_space, r),
+                                 lambda: self.expand_move(board, own, initial_possibility_space, r, max_recursion))
 
+    def expand_move(self, board, own, initial_possibility_space, r, max_recursion):
+        self.stats.expanded(r)
+        queen_moves = self.score_queen_moves(board, own)
         cutoff = self.r_cutoff(initial_possibility_space, r)
-        queen_moves.sort(key=lambda x: x[1], reverse=True)
         queen_moves = queen_moves[:cutoff + 1]
 
-        if r == 0:
-            queen_moves = tqdm(queen_moves)
-
-        moves = []
-        for ((y, x), (move_y, move_x)), evaluation in queen_moves:
-            tmp_board = deepcopy(board)
-            tmp_board = queen_move(tmp_board, ((y, x), (move_y, move_x)))
-            neigh_arrow = self.neighbors(tmp_board, (move_y, move_x))
-            random.shuffle(neigh_arrow)
-            for arrow_y, arrow_x in neigh_arrow[:]:
-                tmp_arrow_board = deepcopy(tmp_board)
-                tmp_arrow_board = arrow_move(tmp_arrow_board, ((move_y, move_x), (arrow_y, arrow_x)))
-                if tmp_arrow_board is None:
-                    continue
-                moves.append((
-                    ((y, x), (move_y, move_x), (arrow_y, arrow_x)),
-                    self.evaluate(tmp_arrow_board, own),
-                    tmp_arrow_board
-                    ))
-
-        moves.sort(key=lambda x: x[1], reverse=True)
+        moves = self.score_arrow_moves(board, own, queen_moves)
         moves = moves[:cutoff*cutoff + 1]
         if len(moves) < 1:
             return []
@@ -324,18 +875,15 @@ class FreeTerror(Terror):
         if r + 1 > max_recursion or self.iterations > self.max_sample:
             return [(moves[0][0], moves[0][1])]
 
-        if r == 0:
-            moves = tqdm(moves)
-
-        def other_color(piece):
-            if piece == Piece.white_amazon:
-                return Piece.black_amazon
-            else:
-                return Piece.white_amazon
+        progress = self.progress if r == 0 else None
 
         deep_moves = []
-        for ((y, x), (move_y, move_x), (arrow_y, arrow_x)), evaluation, board in moves:
+        for i, (((y, x), (move_y, move_x), (arrow_y, arrow_x)), evaluation) in enumerate(moves):
+            record = apply(board, ((y, x), (move_y, move_x), (arrow_y, arrow_x)))
             follow_ups = self.search_move(board, other_color(own), initial_possibility_space, r+1, max_recursion)
+            undo(board, record)
+            if progress is not None:
+                progress(i + 1, len(moves))
             if len(follow_ups) < 1:
                 return [(((y, x), (move_y, move_x), (arrow_y, arrow_x)), 100000)]
 
@@ -347,3 +895,438 @@ class FreeTerror(Terror):
 
         deep_moves.sort(key=lambda x: x[1], reverse=True)
         return deep_moves
+
+
+class _SearchTimeout(Exception):
+    pass
+
+
+class AlphaTerror(Terror):
+    """Iterative-deepening alpha-beta search over the Terror evaluation.
+
+    Every node keeps the move_cutoff best queen moves and the best
+    arrow_cutoff arrows per kept queen move, ordered by their evaluation, and
+    the best move of the previous iteration is searched first. Each iteration
+    starts with an aspiration window around the previous score. When the
+    deadline passes the unfinished iteration is thrown away, so select_move
+    always answers with the best move of the last completed depth.
+    """
+
+    anytime = True
+    WIN = 100000
+    # margin below the shared alpha for parallel root moves, so moves tied with the best stay exact
+    TIE_MARGIN = 1e-9
+
+    def __init__(self, name, distance_eval, unreachable_value, move_cutoff, arrow_cutoff, time_limit=5.0,
+                 max_depth=16, aspiration=1.0, backend='numpy', table=None, workers=1):
+        if table is None:
+            table = TranspositionTable(16 * 2**20)
+        super().__init__(name, distance_eval, unreachable_value, backend, table)
+        self.workers = workers
+        self.move_cutoff = move_cutoff
+        self.arrow_cutoff = arrow_cutoff
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.aspiration = aspiration
+        self.depth_reached = 0
+        # depth of the running iteration, negamax counts its nodes by their distance from the root
+        self.iteration = 0
+        # move ordering of the frontier nodes: the last moves that reached beta there
+        # (killers), and how often and how deep each move reached beta anywhere
+        self.killers = []
+        self.history = {}
+        # Mobility of the searched board, follows play() and take_back()
+        self.mobility = None
+
+    def select_move(self, board, own, deadline=None):
+        """Searches until deadline (a time.monotonic() timestamp), by default time_limit from now"""
+        known = self.known_move(board, own)
+        if known is not None:
+            return known
+        if deadline is None:
+            deadline = time.monotonic() + self.time_limit
+        self.table.new_search()
+        self.killers = []
+        self.history = {move: count // 2 for move, count in self.history.items() if count > 1}
+        self.mobility = Mobility(board)
+
+        # depth 1 is the static ordering and always completes
+        self.stats.expanded(0)
+        moves = self.candidates(board, own)
+        if len(moves) < 1:
+            return super().select_move(board, own)
+        best_move, best_score = moves[0]
+        self.depth_reached = 1
+
+        for depth in range(2, self.max_depth + 1):
+            self.iteration = depth
+            try:
+                alpha = best_score - self.aspiration
+                beta = best_score + self.aspiration
+                move, score = self.search_root(board, own, moves, best_move, depth, alpha, beta, deadline)
+                if score <= alpha or score >= beta:
+                    # fell out of the aspiration window, search again without one
+                    move, score = self.search_root(board, own, moves, best_move, depth, -math.inf, math.inf, deadline)
+            except _SearchTimeout:
+                break
+            best_move, best_score = move, score
+            self.depth_reached = depth
+            if abs(best_score) >= self.WIN:
+                break
+
+        return best_move, best_score
+
+    def frontier_value(self, board, own, beta):
+        """Score of the best candidate, or of the first one found at or above beta.
+
+        Only the maximum matters one move before the horizon, and above beta not
+        even that, so the arrows are evaluated in batches and the rest is skipped
+        once a batch reaches beta. The value is the same as the full candidate
+        list would give whenever it is below beta.
+        """
+        queen_moves = self.score_queen_moves(board, own)[:self.move_cutoff]
+        if len(queen_moves) < 1:
+            return -self.WIN
+
+        best_move, best_score = None, -math.inf
+        for batch in self.staged_arrow_moves(board, own, queen_moves, self.killers, self.history):
+            for move, score in batch:
+                if score > best_score:
+                    best_move, best_score = move, score
+            if best_score >= beta:
+                self.remember_cutoff(best_move, 1)
+                break
+        return best_score
+
+    def remember_cutoff(self, move, depth):
+        # only the frontier orders by killers, the deeper nodes search the candidates best first
+        if depth == 1 and move not in self.killers:
+            self.killers.insert(0, move)
+            del self.killers[2:]
+        self.history[move] = self.history.get(move, 0) + depth * depth
+        self.stats.cutoffs += 1
+
+    def search_root(self, board, own, moves, first, depth, alpha, beta, deadline):
+        self.stats.expanded(0)
+        ordered = [first] + [move for move, _ in moves if move != first]
+        if self.workers > 1 and len(ordered) > 1:
+            return self.search_root_parallel(board, own, ordered, depth, alpha, beta, deadline)
+
+        best_move, best_score = first, -math.inf
+        for i, move in enumerate(ordered):
+            record = self.play(board, move)
+            try:
+                score = -self.negamax(board, other_color(own), depth - 1, -beta, -max(alpha, best_score), deadline)
+            finally:
+                self.take_back(board, record)
+            if self.progress is not None:
+                self.progress(i + 1, len(ordered))
+            if score > best_score:
+                best_move, best_score = move, score
+            if best_score >= beta:
+                break
+        return best_move, best_score
+
+    def search_root_parallel(self, board, own, ordered, depth, alpha, beta, deadline):
+        """Searches the first root move here and the others in the process pool.
+
+        The workers share the best score found so far as their alpha, so a
+        finished move tightens the window of every move started after it. The
+        best exact score wins and ties go to the earlier move, like in search_root.
+        """
+        pool = self.process_pool()
+
+        record = self.play(board, ordered[0])
+        try:
+            first_score = -self.negamax(board, other_color(own), depth - 1, -beta, -alpha, deadline)
+        finally:
+            self.take_back(board, record)
+        if first_score >= beta:
+            return ordered[0], first_score
+
+        self._alpha.value = max(alpha, first_score)
+        data = pack_board(board)
+        futures = [pool.submit(_alpha_root_move, data, own, move, depth, beta, deadline) for move in ordered[1:]]
+
+        best_move, best_score = ordered[0], first_score
+        for i, (move, future) in enumerate(zip(ordered[1:], futures)):
+            result, stats = future.result()
+            self.stats.merge(stats)
+            if self.progress is not None:
+                self.progress(i + 2, len(ordered))
+            if result is None:
+                for rest in futures:
+                    rest.cancel()
+                raise _SearchTimeout()
+            score, exact = result
+            if exact and score > best_score:
+                best_move, best_score = move, score
+        return best_move, best_score
+
+    def play(self, board, move):
+        record = apply(board, move)
+        self.mobility.update(board, record)
+        return record
+
+    def take_back(self, board, record):
+        undo(board, record)
+        self.mobility.update(board, record)
+
+    def negamax(self, board, own, depth, alpha, beta, deadline):
+        if time.monotonic() > deadline:
+            raise _SearchTimeout()
+        if not self.mobility.can_move(own):
+            return -self.WIN
+
+        key = zobrist_hash(board, own)
+        first = None
+        entry = self.table.lookup(key, -1)
+        self.stats.table_lookups += 1
+        if entry is not None:
+            self.stats.table_hits += 1
+            (score, bound, entry_depth), first = entry
+            if entry_depth >= depth:
+                if bound == 0 or (bound > 0 and score >= beta) or (bound < 0 and score <= alpha):
+                    return score
+
+        self.stats.expanded(self.iteration - depth)
+
+        if depth <= 1:
+            # the evaluations of the candidates already look one move ahead
+            return self.frontier_value(board, own, beta)
+
+        moves = self.candidates(board, own)
+        if len(moves) < 1:
+            return -self.WIN
+
+        ordered = [move for move, _ in moves]
+        if first is not None and first in ordered:
+            ordered.remove(first)
+            ordered.insert(0, first)
+
+        original_alpha = alpha
+        best_move, best_score = ordered[0], -math.inf
+        for move in ordered:
+            record = self.play(board, move)
+            try:
+                score = -self.negamax(board, other_color(own), depth - 1, -beta, -alpha, deadline)
+            finally:
+                self.take_back(board, record)
+            if score > best_score:
+                best_move, best_score = move, score
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                self.remember_cutoff(move, depth)
+                break
+
+        # bound: 1 lower bound (cut off), -1 upper bound (nothing raised alpha), 0 exact
+        if best_score >= beta:
+            bound = 1
+        elif best_score <= original_alpha:
+            bound = -1
+        else:
+            bound = 0
+        self.table.store(key, depth, (best_score, bound, depth), best_move)
+        return best_score
+
+
+class _MonteNode:
+    """Node of the MonteTerror tree, wins are counted for the side that played move"""
+
+    __slots__ = ('move', 'parent', 'own', 'children', 'untried', 'visits', 'wins', 'winner')
+
+    def __init__(self, move, parent, own):
+        self.move = move
+        self.parent = parent
+        # side to move in this node
+        self.own = own
+        self.children = []
+        # candidate moves not expanded yet, None until the node is first reached
+        self.untried = None
+        self.visits = 0
+        self.wins = 0.0
+        # set when the side to move has no moves left
+        self.winner = None
+
+
+class MonteTerror(Terror):
+    """Monte Carlo tree search guided by the Terror evaluation.
+
+    Nodes expand the same candidates as AlphaTerror, best first. Playouts make
+    playout_depth random moves ('random') or the best of a few sampled moves
+    ('terror'), then score the board with the Terror evaluation. batch_size
+    leaves are collected with virtual losses and played out together, in one
+    evaluate_many call or spread over the process pool. The tree is kept between
+    calls and re-rooted on the position the opponent's move leads to.
+    """
+
+    anytime = True
+
+    def __init__(self, name, distance_eval, unreachable_value, move_cutoff, arrow_cutoff, time_limit=5.0,
+                 playout_depth=4, playout='random', batch_size=32, exploration=1.4, guide_samples=8,
+                 backend='numpy', workers=1):
+        super().__init__(name, distance_eval, unreachable_value, backend)
+        self.move_cutoff = move_cutoff
+        self.arrow_cutoff = arrow_cutoff
+        self.time_limit = time_limit
+        self.playout_depth = playout_depth
+        self.playout = playout
+        self.batch_size = batch_size
+        self.exploration = exploration
+        self.guide_samples = guide_samples
+        self.workers = workers
+        self.root = None
+        self.root_board = None
+
+    def reroot(self, board, own):
+        """Finds board in the kept tree, either as its root or one move below it"""
+        data = pack_board(board)
+        if self.root is not None:
+            if self.root_board == data and self.root.own == own:
+                return self.root
+
+            old = unpack_board(self.root_board)
+            for child in self.root.children:
+                record = apply(old, child.move)
+                found = pack_board(old) == data and child.own == own
+                undo(old, record)
+                if found:
+                    self.root = child
+                    self.root.parent = None
+                    self.root_board = data
+                    return self.root
+
+        self.root = _MonteNode(None, None, own)
+        self.root_board = data
+        return self.root
+
+    def select_move(self, board, own, deadline=None):
+        known = self.known_move(board, own)
+        if known is not None:
+            return known
+        if deadline is None:
+            deadline = time.monotonic() + self.time_limit
+        root = self.reroot(board, own)
+
+        while time.monotonic() < deadline:
+            leaves = []
+            for _ in range(self.batch_size):
+                path = self.descend(board, root)
+                leaves.append(path)
+                if root.winner is not None:
+                    break
+            self.backpropagate(board, leaves)
+            if root.winner is not None:
+                break
+
+        if len(root.children) < 1:
+            return super().select_move(board, own)
+
+        best = max(root.children, key=lambda child: child.visits)
+
+        # keeps the subtree of the chosen move for the next call
+        record = apply(board, best.move)
+        self.root_board = pack_board(board)
+        undo(board, record)
+        self.root = best
+        best.parent = None
+
+        return best.move, best.wins / max(1, best.visits)
+
+    def descend(self, board, root):
+        """Walks down by UCT, expands one node and returns the path, counting a virtual visit"""
+        node = root
+        path = [node]
+        records = []
+        while node.winner is None:
+            if node.untried is None:
+                self.stats.expanded(len(path) - 1)
+                moves = self.candidates(board, node.own)
+                node.untried = [move for move, _ in reversed(moves)]
+                if len(moves) < 1:
+                    node.winner = other_color(node.own)
+                    break
+            if len(node.untried) > 0:
+                child = _MonteNode(node.untried.pop(), node, other_color(node.own))
+                node.children.append(child)
+                records.append(apply(board, child.move))
+                path.append(child)
+                break
+            log_visits = math.log(max(1, node.visits))
+            node = max(node.children, key=lambda child: child.wins / max(1, child.visits)
+                       + self.exploration * math.sqrt(log_visits / max(1, child.visits)))
+            records.append(apply(board, node.move))
+            path.append(node)
+
+        for n in path:
+            n.visits += 1
+        leaf_data = pack_board(board)
+        for record in reversed(records):
+            undo(board, record)
+        return path, leaf_data
+
+    def backpropagate(self, board, leaves):
+        """Plays out the collected leaves and adds their results along the paths"""
+        pending = [(data, path[-1].own) for path, data in leaves if path[-1].winner is None]
+        if self.workers > 1 and len(pending) > 1:
+            pool = self.process_pool()
+            chunks = [pending[i::self.workers] for i in range(self.workers)]
+            futures = [pool.submit(_monte_playouts, chunk, random.getrandbits(64)) for chunk in chunks if chunk]
+            chunk_results = []
+            for future in futures:
+                chunk, stats = future.result()
+                chunk_results.append(chunk)
+                self.stats.merge(stats)
+            results = [None] * len(pending)
+            for i, chunk in enumerate(chunk_results):
+                results[i::self.workers] = chunk
+        else:
+            results = self.playouts(pending, random.getrandbits(64))
+
+        results = iter(results)
+        for path, data in leaves:
+            leaf = path[-1]
+            if leaf.winner is not None:
+                white_result = 1.0 if leaf.winner == Piece.white_amazon else 0.0
+            else:
+                white_result = next(results)
+            for node in path:
+                # the side that played into node is the one not to move in it
+                if node.own == Piece.black_amazon:
+                    node.wins += white_result
+                else:
+                    node.wins += 1 - white_result
+
+    def playouts(self, leaves, seed):
+        """Plays out packed boards, returning 1 for a white win, 0 for black and 0.5 for even"""
+        rand = random.Random(seed)
+        results = [None] * len(leaves)
+        boards = []
+        scored = []
+        for i, (data, own) in enumerate(leaves):
+            position = BitBoard.from_board(unpack_board(data))
+            for _ in range(self.playout_depth):
+                move = self.playout_move(position, own, rand)
+                if move is None:
+                    results[i] = 0.0 if own == Piece.white_amazon else 1.0
+                    break
+                position = position.play(move)
+                own = other_color(own)
+            if results[i] is None:
+                boards.append(position.to_board())
+                scored.append(i)
+
+        if len(boards) > 0:
+            for i, score in zip(scored, self.evaluate_many(boards, Piece.white_amazon).tolist()):
+                results[i] = 1.0 if score > 0 else 0.0 if score < 0 else 0.5
+        return results
+
+    def playout_move(self, position, own, rand):
+        if self.playout != 'terror':
+            return position.random_move(own, rand)
+
+        samples = [position.random_move(own, rand) for _ in range(self.guide_samples)]
+        if samples[0] is None:
+            return None
+        scores = self.evaluate_many([position.play(move).to_board() for move in samples], own)
+        return samples[int(np.argmax(scores))]
@@ -1,6 +1,7 @@
 extern crate queues;
 
 use std::io;
+use std::io::{BufRead, Write};
 use std::collections::HashMap;
 use rand::prelude::*;
 use queues::*;
@@ -942,15 +943,20 @@ pub fn play_game() {
     }
 }
 
-pub fn read_and_print_move() {
-    // read in input
-    let mut input = String::new();
-    io::stdin().read_line(&mut input).expect("Failed to read line");
+fn compute_move(mut input: String) -> String {
+    // an optional node budget follows the board after a ";"
+    let mut max_count: usize = 10_000;
+    if let Some((board_part, count_part)) = input.clone().split_once(';') {
+        max_count = count_part.trim().parse().unwrap_or(max_count);
+        input = board_part.to_string();
+    }
+
     // remove characters "["", "]", "," and " "
     input = input.replace("[", "");
     input = input.replace("]", "");
     input = input.replace(",", "");
     input = input.replace(" ", "");
+    input = input.trim().to_string();
 
     let turn = &input[0..1];
     let board_string = &input[1..];
@@ -958,8 +964,30 @@ pub fn read_and_print_move() {
     let mut game = string_to_game(board_string.to_string());
     game.turn = turn == "0";
 
-    let full_move_evaluation = obstruction_AI_alpha_beta_hashmap(game, 10_000);
+    let full_move_evaluation = obstruction_AI_alpha_beta_hashmap(game, max_count);
     let move_ = full_move_evaluation.full_move;
 
-    println!("({},{}) ({},{}) ({},{}) My evaluation of this is {}", move_.from.x, move_.from.y, move_.to.x, move_.to.y, move_.shoot.x, move_.shoot.y, full_move_evaluation.score);
-}
\ No newline at end of file
+    format!("({},{}) ({},{}) ({},{}) My evaluation of this is {}", move_.from.x, move_.from.y, move_.to.x, move_.to.y, move_.shoot.x, move_.shoot.y, full_move_evaluation.score)
+}
+
+pub fn read_and_print_move() {
+    // read in input
+    let mut input = String::new();
+    io::stdin().read_line(&mut input).expect("Failed to read line");
+
+    println!("{}", compute_move(input));
+}
+
+// answers one move per input line until stdin is closed
+pub fn serve() {
+    let stdin = io::stdin();
+    let mut stdout = io::stdout();
+    for line in stdin.lock().lines() {
+        let line = line.expect("Failed to read line");
+        if line.trim().is_empty() {
+            continue;
+        }
+        writeln!(stdout, "{}", compute_move(line)).expect("Failed to write move");
+        stdout.flush().expect("Failed to flush move");
+    }
+}
@@ -1,7 +1,12 @@
 mod game;
 
+use std::env;
 
 // main function
 fn main() {
-    game::read_and_print_move();
-}
\ No newline at end of file
+    if env::args().any(|arg| arg == "--serve") {
+        game::serve();
+    } else {
+        game::read_and_print_move();
+    }
+}
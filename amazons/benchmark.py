@@ -0,0 +1,133 @@
+import json
+import math
+import os
+import platform
+import random
+import time
+import numpy as np
+
+from amazons.game import *
+from amazons.agents import *
+
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_positions.json')
+SYMBOLS = {'.': Piece.nothing, 'W': Piece.white_amazon, 'B': Piece.black_amazon, 'x': Piece.arrow}
+
+
+def load_corpus(path=CORPUS):
+    """Positions of the corpus as dicts with name, phase, own and board"""
+    with open(path) as file:
+        positions = json.load(file)
+    for position in positions:
+        position['board'] = [[SYMBOLS[symbol] for symbol in row] for row in position['board']]
+        position['own'] = Piece.white_amazon if position['own'] == 'white' else Piece.black_amazon
+    return positions
+
+
+# the agents of run_script.py, small enough to be measured on every corpus position
+AGENTS = {
+    'Terror': lambda: Terror("Terror", lambda d: 1/min(d, 3), -0.2),
+    'DeepTerror': lambda: DeepTerror("DeepTerror Shiv", lambda d: 1/min(d, 3), -0.2, 7, 7, 4, 2),
+    'FreeTerror': lambda: FreeTerror("FreeTerror Shiv", lambda d: 1/min(d, 3), -0.2, 2,
+                                     lambda p, r: min(max(1, 4-r), int(math.sqrt(p))), 240),
+}
+
+
+def perft(position, own, depth):
+    """Number of full move sequences of the given depth from a BitBoard"""
+    if depth == 0:
+        return 1
+    if depth == 1:
+        return sum(1 for _ in position.moves(own))
+    return sum(perft(position.play(move), other_color(own), depth - 1) for move in position.moves(own))
+
+
+def measure_perft(positions, depth):
+    results = []
+    for position in positions:
+        start = time.perf_counter()
+        nodes = perft(BitBoard.from_board(position['board']), position['own'], depth)
+        seconds = time.perf_counter() - start
+        results.append({'position': position['name'], 'depth': depth, 'nodes': nodes,
+                        'seconds': seconds, 'nodes_per_second': nodes / seconds if seconds > 0 else None})
+    return results
+
+
+def measure_evaluate(positions, backend='numpy', repeat=3):
+    """Single evaluate calls and batched evaluate_many boards per second on the children of every position"""
+    agent = Terror("Terror", lambda d: 1/min(d, 3), -0.2, backend=backend)
+    results = []
+    for position in positions:
+        board, own = position['board'], position['own']
+        moves = list(BitBoard.from_board(board).moves(own))[:256]
+        if not moves:
+            continue
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            agent.evaluate(board, own)
+        single = (time.perf_counter() - start) / repeat
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            agent.evaluate_many(board, own, moves)
+        batched = (time.perf_counter() - start) / repeat
+
+        results.append({'position': position['name'], 'backend': backend,
+                        'evaluate_per_second': 1 / single,
+                        'batch': len(moves), 'batched_boards_per_second': len(moves) / batched})
+    return results
+
+
+def measure_agent(name, make_agent, positions, seed=0):
+    """select_move latency, the move chosen and the SearchStats of the search, per position"""
+    results = []
+    for i, position in enumerate(positions):
+        board = [row[:] for row in position['board']]
+        agent = make_agent()
+        random.seed(seed + i)
+        move, evaluation, stats = agent.search(board, position['own'])
+        seconds, evaluations = stats.seconds, stats.evaluations
+        results.append({'agent': name, 'position': position['name'], 'phase': position['phase'],
+                        'seconds': seconds, 'move': move, 'evaluation': evaluation, 'evaluations': evaluations,
+                        'evaluations_per_second': evaluations / seconds if evaluations and seconds > 0 else None,
+                        'stats': stats.as_dict()})
+    return results
+
+
+def run(positions, agents=AGENTS, perft_depth=1, backend='numpy', seed=0):
+    report = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'seed': seed,
+        'perft': measure_perft(positions, perft_depth),
+        'evaluate': measure_evaluate(positions, backend),
+        'agents': [],
+    }
+    for name, make_agent in agents.items():
+        report['agents'] += measure_agent(name, make_agent, positions, seed)
+    return report
+
+
+def compare(old, new):
+    """Lines describing speed changes and changed choices between two reports"""
+    lines = []
+    old_agents = {(r['agent'], r['position']): r for r in old['agents']}
+    for result in new['agents']:
+        before = old_agents.get((result['agent'], result['position']))
+        if before is None:
+            continue
+        line = f"{result['agent']:>12} {result['position']:<26} {before['seconds']:8.3f}s -> {result['seconds']:8.3f}s"
+        if [list(square) for square in before['move']] != [list(square) for square in result['move']]:
+            line += f"  CHANGED {before['move']} -> {result['move']}"
+        lines.append(line)
+
+    for key, rate in (('perft', 'nodes_per_second'), ('evaluate', 'batched_boards_per_second')):
+        old_rate = sum(r[rate] or 0 for r in old[key])
+        new_rate = sum(r[rate] or 0 for r in new[key])
+        if old_rate > 0:
+            lines.append(f'{key}: {new_rate / old_rate:.2f}x')
+    return lines
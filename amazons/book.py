@@ -0,0 +1,192 @@
+import hashlib
+import random
+import struct
+import numpy as np
+
+from amazons.game import *
+from amazons.agents import other_color
+from amazons import processes
+
+
+MAGIC = b'AMZB'
+VERSION = 1
+# magic, version, board size, entry count, padded to 16 bytes
+HEADER = struct.Struct('<4sHHI4x')
+# entries are sorted by key, the move is (from y, from x, to y, to x, arrow y, arrow x) in canonical coordinates
+ENTRY = np.dtype([('key', '<u8'), ('move', 'u1', (6,)), ('value', '<f4')])
+
+
+def transform(position, symmetry, size):
+    """Maps (y, x) by one of the 8 board symmetries: bit 2 transposes, bit 0 flips y, bit 1 flips x"""
+    y, x = position
+    if symmetry & 4:
+        y, x = x, y
+    if symmetry & 1:
+        y = size - 1 - y
+    if symmetry & 2:
+        x = size - 1 - x
+    return y, x
+
+
+def inverse_transform(position, symmetry, size):
+    y, x = position
+    if symmetry & 2:
+        x = size - 1 - x
+    if symmetry & 1:
+        y = size - 1 - y
+    if symmetry & 4:
+        y, x = x, y
+    return y, x
+
+
+def canonical(board, own):
+    """Returns (key, symmetry) of the smallest of the 8 symmetric images of the position"""
+    size = len(board)
+    squares = np.frombuffer(pack_board(board), dtype=np.uint8).reshape(size, size)
+    best = None
+    for symmetry in range(8):
+        image = squares.T if symmetry & 4 else squares
+        if symmetry & 1:
+            image = image[::-1]
+        if symmetry & 2:
+            image = image[:, ::-1]
+        data = image.tobytes()
+        if best is None or data < best[0]:
+            best = (data, symmetry)
+
+    digest = hashlib.blake2b(bytes([own.value]) + best[0], digest_size=8).digest()
+    return int.from_bytes(digest, 'little'), best[1]
+
+
+class OpeningBook:
+    """Best moves of early positions, looked up under the 8 board symmetries.
+
+    Books are written by write() and read by load(), which memory-maps the
+    file, so a book costs no load time and its pages are shared between the
+    processes that use it.
+    """
+
+    def __init__(self, size, entries, path=None):
+        self.size = size
+        self.entries = entries
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as file:
+            magic, version, size, count = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not an opening book of version {VERSION}')
+        if count == 0:
+            entries = np.zeros(0, dtype=ENTRY)
+        else:
+            entries = np.memmap(path, dtype=ENTRY, mode='r', offset=HEADER.size, shape=(count,))
+        return cls(size, entries, path)
+
+    @classmethod
+    def from_moves(cls, size, moves):
+        """Builds a book from a dict of canonical key to (canonical move, value)"""
+        entries = np.zeros(len(moves), dtype=ENTRY)
+        for i, (key, (move, value)) in enumerate(sorted(moves.items())):
+            entries[i] = (key, [c for square in move for c in square], value)
+        return cls(size, entries)
+
+    def write(self, path):
+        with open(path, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, self.size, len(self.entries)))
+            file.write(np.ascontiguousarray(self.entries).tobytes())
+        self.path = path
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getstate__(self):
+        # worker processes map the file again instead of receiving a copy of it
+        state = self.__dict__.copy()
+        if self.path is not None:
+            state['entries'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.entries is None:
+            self.entries = OpeningBook.load(self.path).entries
+
+    def lookup(self, board, own):
+        """Returns (move, evaluation) for the position or None if it isn't in the book"""
+        if len(board) != self.size or len(board[0]) != self.size:
+            return None
+        key, symmetry = canonical(board, own)
+        keys = self.entries['key']
+        i = int(np.searchsorted(keys, np.uint64(key)))
+        if i >= len(keys) or int(keys[i]) != key:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        coordinates = [int(c) for c in self.entries['move'][i]]
+        move = tuple(inverse_transform((coordinates[j], coordinates[j + 1]), symmetry, self.size) for j in range(0, 6, 2))
+        return move, float(self.entries['value'][i])
+
+
+def _book_search(data, own, width, seed):
+    """Searches a packed position, returns its move, evaluation and the moves to follow from it"""
+    random.seed(seed)
+    agent = processes.worker['agent']
+    board = unpack_board(data)
+    move, value = agent.select_move(board, own)
+    if move is None:
+        return None, value, []
+
+    follow = [move]
+    if width > 1:
+        queen_moves = agent.score_queen_moves(board, own)[:width]
+        for candidate, _ in agent.score_arrow_moves(board, own, queen_moves)[:width]:
+            if len(follow) >= width:
+                break
+            if candidate != move:
+                follow.append(candidate)
+    return move, value, follow
+
+
+def build(agent, board, own, plies, width, workers=1, seed=0, progress=None):
+    """Searches the positions of the first plies from board with a Terror agent.
+
+    Every position gets the agent's move. The next ply follows that move and the
+    width - 1 best other moves by the static evaluation, for both sides, since
+    the book is used whichever color the bot plays. Positions that are
+    symmetric to one already searched are skipped. progress(ply, done, total)
+    is called after every searched position.
+    """
+    size = len(board)
+    moves = {}
+    frontier = [(pack_board(board), own)]
+
+    with processes.pool(workers, agent=agent) as pool:
+        for ply in range(plies):
+            positions = {}
+            for data, color in frontier:
+                key, symmetry = canonical(unpack_board(data), color)
+                if key not in moves and key not in positions:
+                    positions[key] = (data, color, symmetry)
+
+            tasks = {key: pool.submit(_book_search, data, color, width if ply + 1 < plies else 1, seed + i)
+                     for i, (key, (data, color, symmetry)) in enumerate(positions.items())}
+
+            frontier = []
+            for done, (key, task) in enumerate(tasks.items()):
+                data, color, symmetry = positions[key]
+                move, value, follow = task.result()
+                if move is None:
+                    continue
+                moves[key] = (tuple(transform(square, symmetry, size) for square in move), value)
+                for follow_move in follow:
+                    follow_board = unpack_board(data)
+                    apply(follow_board, follow_move)
+                    frontier.append((pack_board(follow_board), other_color(color)))
+                if progress is not None:
+                    progress(ply, done + 1, len(tasks))
+
+    return OpeningBook.from_moves(size, moves)
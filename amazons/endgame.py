@@ -0,0 +1,189 @@
+from functools import lru_cache
+
+from amazons.game import *
+
+
+class Region:
+    """A connected area of empty squares and the amazons that touch it.
+
+    kind is 'owned' when only one color has amazons in it (owner is that
+    color), 'contested' when both have and 'dead' when no amazon can get in.
+    """
+
+    def __init__(self, squares, white, black):
+        self.squares = squares
+        self.white = white
+        self.black = black
+        if white and black:
+            self.kind, self.owner = 'contested', None
+        elif white:
+            self.kind, self.owner = 'owned', Piece.white_amazon
+        elif black:
+            self.kind, self.owner = 'owned', Piece.black_amazon
+        else:
+            self.kind, self.owner = 'dead', None
+
+    def amazons(self, color):
+        return self.white if color == Piece.white_amazon else self.black
+
+    def __repr__(self):
+        return f'Region({self.kind}, {len(self.squares)} squares, {len(self.white)} white, {len(self.black)} black)'
+
+
+def regions(board):
+    """Splits the board into Regions with a union-find over empty squares and amazons"""
+    size = len(board)
+    parent = list(range(size * size))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    # every queen step is between neighbours, so 8-connectivity is reachability
+    for y in range(size):
+        for x in range(size):
+            if board[y][x] == Piece.arrow:
+                continue
+            for dy, dx in ((0, 1), (1, -1), (1, 0), (1, 1)):
+                new_y, new_x = y + dy, x + dx
+                if 0 <= new_y < size and 0 <= new_x < size and board[new_y][new_x] != Piece.arrow:
+                    # amazons next to each other connect too, one can step where the other was
+                    a, b = find(y * size + x), find(new_y * size + new_x)
+                    if a != b:
+                        parent[a] = b
+
+    groups = {}
+    for y in range(size):
+        for x in range(size):
+            piece = board[y][x]
+            if piece == Piece.arrow:
+                continue
+            squares, white, black = groups.setdefault(find(y * size + x), (set(), [], []))
+            if piece == Piece.nothing:
+                squares.add((y, x))
+            elif piece == Piece.white_amazon:
+                white.append((y, x))
+            else:
+                black.append((y, x))
+
+    return [Region(frozenset(squares), white, black) for squares, white, black in groups.values()]
+
+
+def _targets(empty, y, x):
+    """Queen targets from (y, x) over the given set of empty squares"""
+    targets = []
+    for dy, dx in DIRECTIONS:
+        new_y, new_x = y + dy, x + dx
+        while (new_y, new_x) in empty:
+            targets.append((new_y, new_x))
+            new_y, new_x = new_y + dy, new_x + dx
+    return targets
+
+
+def _components(empty, amazons):
+    """Groups of the amazons with the empty squares they can still reach"""
+    groups = []
+    seen = set()
+    for amazon in amazons:
+        if amazon in seen:
+            continue
+        group_amazons, group_empty = [amazon], set()
+        seen.add(amazon)
+        stack = [amazon]
+        while stack:
+            y, x = stack.pop()
+            for dy, dx in DIRECTIONS:
+                square = (y + dy, x + dx)
+                if square in seen:
+                    continue
+                if square in empty:
+                    group_empty.add(square)
+                elif square in amazons:
+                    group_amazons.append(square)
+                else:
+                    continue
+                seen.add(square)
+                stack.append(square)
+        groups.append((group_empty, group_amazons))
+    return groups
+
+
+def _shifted_fill(empty, amazons):
+    """_fill on the area moved to the corner, so equal shapes share one memo entry"""
+    squares = list(empty) + list(amazons)
+    top = min(y for y, x in squares)
+    left = min(x for y, x in squares)
+    count, move = _fill(frozenset((y - top, x - left) for y, x in empty),
+                        frozenset((y - top, x - left) for y, x in amazons))
+    if move is None:
+        return 0, None
+    return count, tuple((y + top, x + left) for y, x in move)
+
+
+@lru_cache(maxsize=2**18)
+def _fill(empty, amazons):
+    """Most moves the amazons can make in the empty squares, with the first of them"""
+    groups = _components(empty, amazons)
+    if len(groups) > 1 or len(groups[0][0]) < len(empty):
+        # squares nobody reaches don't count and separate areas add up
+        total, first = 0, None
+        for group_empty, group_amazons in groups:
+            count, move = _shifted_fill(group_empty, group_amazons)
+            total += count
+            if first is None:
+                first = move
+        return total, first
+
+    best, best_move = 0, None
+    for amazon in amazons:
+        others = amazons - {amazon}
+        for target in _targets(empty, *amazon):
+            after_move = (empty - {target}) | {amazon}
+            for arrow in _targets(after_move, *target):
+                count = 1 + _fill(after_move - {arrow}, others | {target})[0]
+                if count > best:
+                    best, best_move = count, (amazon, target, arrow)
+                    # every move fills one square, so this can't be beaten
+                    if best == len(empty):
+                        return best, best_move
+    return best, best_move
+
+
+def fill(region, color):
+    """Exact (moves, first move) of color in a region nobody else can enter.
+
+    Regions are memoized by shape, wherever they are on the board.
+    """
+    amazons = region.amazons(color)
+    if not amazons:
+        return 0, None
+    return _shifted_fill(region.squares, amazons)
+
+
+def solve(board, own, limit=16):
+    """Solves a position whose regions are all separated.
+
+    Returns (move, own moves, opponent moves) with the move that keeps the most
+    moves for own (None if own can't move), or None while a region is still
+    contested or an owned region has more than limit empty squares. own wins
+    exactly when it has more moves left than the opponent.
+    """
+    split = regions(board)
+    for region in split:
+        if region.kind == 'contested' or (region.kind == 'owned' and len(region.squares) > limit):
+            return None
+
+    counts = {Piece.white_amazon: 0, Piece.black_amazon: 0}
+    best_move, best_count = None, 0
+    for region in split:
+        if region.kind != 'owned':
+            continue
+        count, move = fill(region, region.owner)
+        counts[region.owner] += count
+        if region.owner == own and count > best_count:
+            best_move, best_count = move, count
+
+    opponent = Piece.black_amazon if own == Piece.white_amazon else Piece.white_amazon
+    return best_move, counts[own], counts[opponent]
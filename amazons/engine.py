@@ -0,0 +1,368 @@
+import asyncio
+import logging
+import time
+
+from amazons import game
+from amazons import processes
+
+logger = logging.getLogger('amazons')
+
+
+class EngineError(Exception):
+    pass
+
+
+class ServiceBusy(Exception):
+    pass
+
+
+class GameCancelled(Exception):
+    pass
+
+
+def _service_move(name, data, own, deadline):
+    agent = processes.worker['agents'][name]
+    board = game.unpack_board(data)
+    if deadline is None or not agent.anytime:
+        return agent.search(board, own)
+    return agent.search(board, own, deadline=deadline)
+
+
+def board_from_data(board_data):
+    """Turns the board sent by the opponent bot into a list of Piece rows"""
+    return [[game.Piece(column) for column in row] for row in board_data]
+
+
+def own_piece(turn):
+    if turn == game.Player.white.value:
+        return game.Piece.white_amazon
+    else:
+        return game.Piece.black_amazon
+
+
+def is_over(turn, board_data):
+    """Checks if the side to move is out of moves"""
+    return not game.BitBoard.from_board(board_from_data(board_data)).can_move(own_piece(turn))
+
+
+def format_move(move, evaluation, stats=None):
+    """Formats a move like the Rust engine does, coordinates as x,y, with a summary of the SearchStats if given"""
+    (start_y, start_x), (move_y, move_x), (shoot_y, shoot_x) = move
+    line = f'({start_x},{start_y}) ({move_x},{move_y}) ({shoot_x},{shoot_y}) My evaluation of this is {evaluation}'
+    if stats is not None:
+        line += f' ({stats})'
+    return line
+
+
+class EngineWorker:
+    """Long-lived engine process answering one move request per line.
+
+    A request is the line the one-shot engine used to read from input.txt, the
+    turn followed by the board. The process is started on first use and
+    restarted when it dies or stops answering. If it can't answer even after a
+    restart, the fallback (if any) is asked for the move instead.
+    """
+
+    def __init__(self, command, fallback=None, timeout=60, retries=1):
+        self.command = command
+        self.fallback = fallback
+        self.timeout = timeout
+        self.retries = retries
+        self.process = None
+        self.restarts = 0
+        self.lock = asyncio.Lock()
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            *self.command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL)
+
+    async def stop(self):
+        if self.process is None:
+            return
+        if self.process.returncode is None:
+            try:
+                self.process.stdin.close()
+                await asyncio.wait_for(self.process.wait(), 5)
+            except (asyncio.TimeoutError, OSError):
+                self.process.kill()
+                await self.process.wait()
+        self.process = None
+
+    async def request(self, line):
+        """Sends one request line and returns the answer line, restarting the engine if needed"""
+        async with self.lock:
+            for attempt in range(self.retries + 1):
+                try:
+                    if not self.running:
+                        await self.start()
+                    self.process.stdin.write(line.encode('utf-8') + b'\n')
+                    await self.process.stdin.drain()
+                    response = await asyncio.wait_for(self.process.stdout.readline(), self.timeout)
+                    if not response:
+                        raise EngineError('engine closed its output')
+                    return response.decode('utf-8').strip()
+                except (EngineError, OSError, asyncio.TimeoutError) as e:
+                    logger.error(f'Amazons engine failed ({type(e).__name__}: {e}), restarting')
+                    if self.process is not None and self.process.returncode is None:
+                        self.process.kill()
+                        await self.process.wait()
+                    self.process = None
+                    self.restarts += 1
+            raise EngineError(f'engine did not answer after {self.retries + 1} attempts')
+
+    async def select_move(self, turn, board_data, game_id=None, max_count=None, deadline=None):
+        """Returns the move line for the board, from the engine or else the fallback.
+
+        max_count is the node budget of the engine, its own default if None.
+        fallback is a coroutine function taking (game_id, turn, board_data,
+        deadline), for example MoveService.move_line bound to an agent name.
+        """
+        line = str(turn) + ' ' + str(board_data)
+        if max_count is not None:
+            line += f';{max_count}'
+        try:
+            return await self.request(line)
+        except EngineError:
+            if self.fallback is None:
+                raise
+        return await self.fallback(game_id, turn, board_data, deadline)
+
+
+class MoveService:
+    """Runs Python agent searches in worker processes, off the event loop.
+
+    At most max_jobs jobs wait or run at once, compute() raises ServiceBusy
+    beyond that. Jobs of the same game run one after another, jobs of different games
+    in parallel up to the number of workers. Only anytime agents get the
+    deadline, the others search as usual. cancel_game() fails the pending
+    jobs of a game with GameCancelled; a search already running in a worker
+    finishes, but its result is dropped.
+
+    Agents are registered by name and copied into the workers when they start.
+    Workers are forked where possible, elsewhere the agents have to be picklable.
+    """
+
+    def __init__(self, agents, workers=2, max_jobs=16):
+        self.agents = agents
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.queue = asyncio.Queue()
+        self.pool = None
+        self.runners = []
+        self.pending = {}
+        self.locks = {}
+
+    def start(self):
+        self.pool = processes.pool(self.workers, agents=self.agents)
+        self.runners = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def shutdown(self):
+        for runner in self.runners:
+            runner.cancel()
+        self.runners = []
+        for game_id in list(self.pending):
+            self.cancel_game(game_id)
+        if self.pool is not None:
+            await asyncio.to_thread(self.pool.shutdown, wait=True, cancel_futures=True)
+            self.pool = None
+
+    @property
+    def queue_depth(self):
+        return sum(len(futures) for futures in self.pending.values())
+
+    def cancel_game(self, game_id):
+        # the game's lock stays, a job already running still holds it
+        for future in self.pending.pop(game_id, []):
+            if not future.done():
+                future.set_exception(GameCancelled(game_id))
+
+    async def compute(self, game_id, name, board, own, deadline=None):
+        """Searches a move for board with the agent registered as name, returns (move, evaluation, SearchStats)"""
+        if self.pool is None:
+            self.start()
+
+        if self.queue_depth >= self.max_jobs:
+            raise ServiceBusy(f'{self.queue_depth} moves are already waiting')
+
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((game_id, name, game.pack_board(board), own, deadline, future))
+        self.pending.setdefault(game_id, []).append(future)
+        try:
+            return await future
+        finally:
+            if future in self.pending.get(game_id, []):
+                self.pending[game_id].remove(future)
+                if not self.pending[game_id]:
+                    del self.pending[game_id]
+
+    async def move_line(self, game_id, name, turn, board_data, deadline=None, show_stats=False):
+        """Like compute, but takes and returns what the engine protocol uses.
+
+        The statistics of the search are logged, and added to the line with show_stats.
+        """
+        board = board_from_data(board_data)
+        move, value, stats = await self.compute(game_id, name, board, own_piece(turn), deadline)
+        logger.info(f'Amazons game {game_id}, {name}: {stats}')
+        return format_move(move, value, stats if show_stats else None)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            game_id, name, data, own, deadline, future = await self.queue.get()
+            try:
+                if future.done():
+                    continue
+                if game_id not in self.locks:
+                    self.locks[game_id] = asyncio.Lock()
+                async with self.locks[game_id]:
+                    if future.done():
+                        continue
+                    result = await loop.run_in_executor(self.pool, _service_move, name, data, own, deadline)
+                    if not future.done():
+                        future.set_result(result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self.queue.task_done()
+                self._drop_lock(game_id)
+
+    def _drop_lock(self, game_id):
+        """Forgets the lock of a game once it is free and no job of the game is left to run"""
+        lock = self.locks.get(game_id)
+        if lock is None or lock.locked():
+            return
+        if all(future.done() for future in self.pending.get(game_id, [])):
+            del self.locks[game_id]
+
+
+class ScheduledGame:
+
+    def __init__(self, game_id):
+        self.game_id = game_id
+        self.weight = 1.0
+        self.last_seen = time.monotonic()
+        self.moves = 0
+        self.waited = 0.0
+        self.searched = 0.0
+
+
+class GameScheduler:
+    """Shares a fixed amount of search between the games being played.
+
+    A move of a lone game may use nodes_per_move engine nodes and
+    seconds_per_move seconds. With more games, each move gets its game's share
+    of slots times that budget, weighted by game phase: the middle game gets
+    the most, the decided endgame the least. Moves wait for one of the slots,
+    so the total load stays the same however many games are running, and the
+    time between two moves of a game stays around seconds_per_move instead of
+    growing with every new game.
+
+    Games are dropped when they end (finish()) or after idle_timeout seconds
+    without a move.
+    """
+
+    # (fraction of empty squares above which, weight)
+    PHASE_WEIGHTS = ((0.8, 1.0), (0.5, 1.5), (0.25, 1.0), (0.0, 0.5))
+
+    def __init__(self, slots=1, nodes_per_move=10_000, seconds_per_move=10.0, min_share=0.1, idle_timeout=1800):
+        self.slots = slots
+        self.nodes_per_move = nodes_per_move
+        self.seconds_per_move = seconds_per_move
+        self.min_share = min_share
+        self.idle_timeout = idle_timeout
+        self.games = {}
+        self.semaphore = asyncio.Semaphore(slots)
+        self.waiting = 0
+        self.running = 0
+        self.moves = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @classmethod
+    def phase_weight(cls, board_data):
+        squares = [square for row in board_data for square in row]
+        empty = squares.count(game.Piece.nothing.value) / len(squares)
+        for threshold, weight in cls.PHASE_WEIGHTS:
+            if empty > threshold:
+                return weight
+        return cls.PHASE_WEIGHTS[-1][1]
+
+    def update(self, game_id, board_data):
+        """Registers a move request of game_id, returns its ScheduledGame"""
+        now = time.monotonic()
+        for other_id, other in list(self.games.items()):
+            if now - other.last_seen > self.idle_timeout:
+                del self.games[other_id]
+        if game_id not in self.games:
+            self.games[game_id] = ScheduledGame(game_id)
+        scheduled = self.games[game_id]
+        scheduled.weight = self.phase_weight(board_data)
+        scheduled.last_seen = now
+        return scheduled
+
+    def finish(self, game_id):
+        self.games.pop(game_id, None)
+
+    def share(self, game_id):
+        """Fraction of a full move budget the next move of game_id gets"""
+        total = sum(scheduled.weight for scheduled in self.games.values())
+        if game_id not in self.games or total == 0:
+            return 1.0
+        share = self.slots * self.games[game_id].weight / total
+        return min(1.0, max(self.min_share, share))
+
+    def budget(self, game_id):
+        """Returns (nodes, seconds) for the next move of game_id"""
+        share = self.share(game_id)
+        return int(self.nodes_per_move * share), self.seconds_per_move * share
+
+    async def run(self, game_id, board_data, compute):
+        """Waits for a slot and awaits compute(max_count, deadline) with the game's budget"""
+        scheduled = self.update(game_id, board_data)
+        queued = time.monotonic()
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            started = time.monotonic()
+            wait = started - queued
+            self.moves += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            scheduled.waited += wait
+
+            nodes, seconds = self.budget(game_id)
+            result = await compute(nodes, started + seconds)
+            scheduled.moves += 1
+            scheduled.searched += time.monotonic() - started
+            return result
+        finally:
+            self.running -= 1
+            self.semaphore.release()
+
+    @property
+    def queue_depth(self):
+        return self.waiting
+
+    @property
+    def average_wait(self):
+        if self.moves == 0:
+            return 0.0
+        return self.total_wait / self.moves
+
+    def __str__(self):
+        return (f'{len(self.games)} active games, {self.running} searching, {self.waiting} waiting, '
+                f'average wait {self.average_wait:.2f}s, longest wait {self.max_wait:.2f}s')
@@ -1,7 +1,9 @@
 from copy import deepcopy
-from math import copysign
 from enum import Enum
+from functools import lru_cache
+from math import isqrt
 from random import Random
+import time
 
 
 class Player(Enum):
@@ -22,38 +24,418 @@ class MoveState(Enum):
     game_over = 2
 
 
+# (dy, dx) steps of the eight queen directions
+DIRECTIONS = [(dy, dx) for dy in range(-1, 2) for dx in range(-1, 2) if (dy, dx) != (0, 0)]
+
+
+DIRECTION_INDEX = {direction: i for i, direction in enumerate(DIRECTIONS)}
+
+
+@lru_cache(maxsize=None)
+def ray_table(size):
+    """Precomputed queen rays of a board of the given size.
+
+    ray_table(size)[y][x][d] is the tuple of squares (y, x) on the ray leaving
+    (y, x) in direction DIRECTIONS[d], ordered by distance and ending at the edge.
+    """
+    table = []
+    for y in range(size):
+        row = []
+        for x in range(size):
+            rays = []
+            for dy, dx in DIRECTIONS:
+                ray = []
+                k = 1
+                while 0 <= y+dy*k < size and 0 <= x+dx*k < size:
+                    ray.append((y+dy*k, x+dx*k))
+                    k += 1
+                rays.append(tuple(ray))
+            row.append(tuple(rays))
+        table.append(tuple(row))
+    return tuple(table)
+
+
+@lru_cache(maxsize=None)
+def zobrist_keys(size, seed=0):
+    """Random 64 bit keys for every piece on every square and for black to move"""
+    rand = Random(seed)
+    keys = {}
+    for piece in (Piece.white_amazon, Piece.black_amazon, Piece.arrow):
+        keys[piece] = [[rand.getrandbits(64) for x in range(size)] for y in range(size)]
+    return keys, rand.getrandbits(64)
+
+
+def zobrist_hash(board, own):
+    """Zobrist hash of the board with own to move"""
+    keys, black_to_move = zobrist_keys(len(board))
+    key = black_to_move if own == Piece.black_amazon else 0
+    for y, row in enumerate(board):
+        for x, piece in enumerate(row):
+            if piece != Piece.nothing:
+                key ^= keys[piece][y][x]
+    return key
+
+
+@lru_cache(maxsize=None)
+def _bitboard_layout(size):
+    """Returns the mask of all board squares and the bit shift of every direction"""
+    width = size + 1
+    board_mask = 0
+    for y in range(size):
+        board_mask |= ((1 << size) - 1) << (y * width)
+    shifts = tuple(dy * width + dx for dy, dx in DIRECTIONS)
+    return board_mask, shifts
+
+
+def _ray_fill(origin, empty, shifts):
+    """All squares reachable from the origin bits by sliding over empty squares"""
+    targets = 0
+    for s in shifts:
+        if s > 0:
+            ray = (origin << s) & empty
+            while ray:
+                targets |= ray
+                ray = (ray << s) & empty
+        else:
+            ray = (origin >> -s) & empty
+            while ray:
+                targets |= ray
+                ray = (ray >> -s) & empty
+    return targets
+
+
+def _squares(mask, width):
+    """Yields the (y, x) coordinates of all set bits"""
+    while mask:
+        low = mask & -mask
+        yield divmod(low.bit_length() - 1, width)
+        mask ^= low
+
+
+class BitBoard:
+    """Compact position stored as packed integer bitboards.
+
+    Square (y, x) is bit y*(size+1) + x. Every row has one padding bit on the
+    right which is never part of the board, so shifting a mask sideways can't
+    wrap around into the neighbouring row.
+    """
+
+    __slots__ = ('size', 'white', 'black', 'arrows')
+
+    def __init__(self, size=10, white=0, black=0, arrows=0):
+        self.size = size
+        self.white = white
+        self.black = black
+        self.arrows = arrows
+
+    @classmethod
+    def from_board(cls, board):
+        position = cls(len(board))
+        width = position.width
+        for y, row in enumerate(board):
+            for x, piece in enumerate(row):
+                if piece == Piece.white_amazon:
+                    position.white |= 1 << (y * width + x)
+                elif piece == Piece.black_amazon:
+                    position.black |= 1 << (y * width + x)
+                elif piece == Piece.arrow:
+                    position.arrows |= 1 << (y * width + x)
+        return position
+
+    def to_board(self):
+        board = [[Piece.nothing for _ in range(self.size)] for _ in range(self.size)]
+        for piece in (Piece.white_amazon, Piece.black_amazon, Piece.arrow):
+            for y, x in _squares(self.mask(piece), self.width):
+                board[y][x] = piece
+        return board
+
+    def copy(self):
+        return BitBoard(self.size, self.white, self.black, self.arrows)
+
+    def __eq__(self, other):
+        if not isinstance(other, BitBoard):
+            return NotImplemented
+        return (self.size, self.white, self.black, self.arrows) == (other.size, other.white, other.black, other.arrows)
+
+    def __hash__(self):
+        return hash((self.size, self.white, self.black, self.arrows))
+
+    @property
+    def width(self):
+        return self.size + 1
+
+    @property
+    def occupancy(self):
+        return self.white | self.black | self.arrows
+
+    @property
+    def empty(self):
+        return _bitboard_layout(self.size)[0] & ~(self.white | self.black | self.arrows)
+
+    def bit(self, y, x):
+        return 1 << (y * self.width + x)
+
+    def mask(self, piece):
+        if piece == Piece.white_amazon:
+            return self.white
+        if piece == Piece.black_amazon:
+            return self.black
+        if piece == Piece.arrow:
+            return self.arrows
+        return self.empty
+
+    def squares(self, piece):
+        return list(_squares(self.mask(piece), self.width))
+
+    def queen_targets(self, y, x):
+        """Bitmask of the squares a queen on (y, x) can reach"""
+        _, shifts = _bitboard_layout(self.size)
+        return _ray_fill(self.bit(y, x), self.empty, shifts)
+
+    def queen_moves(self, y, x):
+        return list(_squares(self.queen_targets(y, x), self.width))
+
+    def reach(self, own):
+        """Bitmask of the squares any amazon of the side own can move to"""
+        _, shifts = _bitboard_layout(self.size)
+        return _ray_fill(self.mask(own), self.empty, shifts)
+
+    def moves(self, own):
+        """Yields every full move (move_from, move_to, arrow_to) of the side own"""
+        _, shifts = _bitboard_layout(self.size)
+        width = self.width
+        empty = self.empty
+        for y, x in _squares(self.mask(own), width):
+            origin = 1 << (y * width + x)
+            for to in _squares(_ray_fill(origin, empty, shifts), width):
+                to_bit = 1 << (to[0] * width + to[1])
+                arrow_empty = (empty | origin) & ~to_bit
+                for arrow in _squares(_ray_fill(to_bit, arrow_empty, shifts), width):
+                    yield (y, x), to, arrow
+
+    def can_move(self, own):
+        """Checks if any amazon of the side own has an empty neighbouring square"""
+        _, shifts = _bitboard_layout(self.size)
+        pieces = self.mask(own)
+        empty = self.empty
+        for s in shifts:
+            if (pieces << s if s > 0 else pieces >> -s) & empty:
+                return True
+        return False
+
+    def random_move(self, own, rand):
+        """A random full move of the side own, None if it can't move"""
+        # makes a list of all the pieces we can move
+        potential_pieces = [p for p in self.squares(own) if self.queen_targets(*p)]
+        if len(potential_pieces) < 1:
+            return None
+
+        # finds the movements a random piece can make
+        move_from = rand.choice(potential_pieces)
+        move_to = rand.choice(self.queen_moves(*move_from))
+
+        # moves the amazon to find a random arrow place
+        position = self.copy()
+        if own == Piece.white_amazon:
+            position.white ^= position.bit(*move_from) | position.bit(*move_to)
+        else:
+            position.black ^= position.bit(*move_from) | position.bit(*move_to)
+
+        arrow_to = rand.choice(position.queen_moves(*move_to))
+        return move_from, move_to, arrow_to
+
+    def play(self, move):
+        """Returns the position after the full move, without validating it"""
+        (y1, x1), (y2, x2), (y3, x3) = move
+        width = self.width
+        from_bit = 1 << (y1 * width + x1)
+        to_bit = 1 << (y2 * width + x2)
+        position = self.copy()
+        if self.white & from_bit:
+            position.white ^= from_bit | to_bit
+        else:
+            position.black ^= from_bit | to_bit
+        position.arrows |= 1 << (y3 * width + x3)
+        return position
+
+
+class Mobility:
+    """Empty neighbouring squares of every amazon of a board, kept up to date per move.
+
+    An amazon can move exactly when one of its neighbours is empty, so
+    can_move() answers in constant time. After a change to the board, update()
+    only looks at the neighbourhoods of the squares that changed.
+    """
+
+    def __init__(self, board):
+        self.size = len(board)
+        # (y, x) -> (amazon, empty neighbours)
+        self.amazons = {}
+        self.movable = {Piece.white_amazon: 0, Piece.black_amazon: 0}
+        self.update(board, [(y, x) for y in range(self.size) for x in range(self.size)])
+
+    def empty_neighbours(self, board, y, x):
+        count = 0
+        for dy, dx in DIRECTIONS:
+            new_y, new_x = y + dy, x + dx
+            if 0 <= new_y < self.size and 0 <= new_x < self.size and board[new_y][new_x] == Piece.nothing:
+                count += 1
+        return count
+
+    def update(self, board, squares):
+        """Refreshes the amazons around the given changed squares, for example a record of apply()"""
+        touched = set()
+        for square in squares:
+            if square is None:
+                continue
+            y, x = square
+            for dy in range(-1, 2):
+                for dx in range(-1, 2):
+                    if 0 <= y + dy < self.size and 0 <= x + dx < self.size:
+                        touched.add((y + dy, x + dx))
+
+        for y, x in touched:
+            old = self.amazons.pop((y, x), None)
+            if old is not None and old[1] > 0:
+                self.movable[old[0]] -= 1
+            piece = board[y][x]
+            if piece in (Piece.white_amazon, Piece.black_amazon):
+                count = self.empty_neighbours(board, y, x)
+                self.amazons[(y, x)] = (piece, count)
+                if count > 0:
+                    self.movable[piece] += 1
+
+    def can_move(self, own):
+        return self.movable[own] > 0
+
+    def mobility(self, y, x):
+        """Empty neighbours of the amazon on (y, x), 0 if there is no amazon"""
+        amazon = self.amazons.get((y, x))
+        if amazon is None:
+            return 0
+        return amazon[1]
+
+
+class SearchStats:
+    """What an agent did to find a move, filled in while it searches.
+
+    nodes counts the positions expanded per depth, the root being depth 0.
+    evaluations counts the positions scored and evaluate_calls the batches
+    they were scored in. cutoffs counts the nodes left early at beta and
+    table_lookups/table_hits the transposition table probes. generation_seconds
+    and evaluation_seconds split the time spent generating and ordering moves
+    from the time spent evaluating, summed over worker processes, so together
+    they can exceed seconds, the wall time of the whole select_move.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.evaluations = 0
+        self.evaluate_calls = 0
+        self.cutoffs = 0
+        self.table_lookups = 0
+        self.table_hits = 0
+        self.generation_seconds = 0.0
+        self.evaluation_seconds = 0.0
+        self.seconds = 0.0
+
+    def expanded(self, depth):
+        self.nodes[depth] = self.nodes.get(depth, 0) + 1
+
+    def merge(self, other):
+        """Adds the counts of another search, for example one of a worker process"""
+        for depth, count in other.nodes.items():
+            self.nodes[depth] = self.nodes.get(depth, 0) + count
+        self.evaluations += other.evaluations
+        self.evaluate_calls += other.evaluate_calls
+        self.cutoffs += other.cutoffs
+        self.table_lookups += other.table_lookups
+        self.table_hits += other.table_hits
+        self.generation_seconds += other.generation_seconds
+        self.evaluation_seconds += other.evaluation_seconds
+
+    @property
+    def total_nodes(self):
+        return sum(self.nodes.values())
+
+    @property
+    def depth(self):
+        """Deepest depth that was expanded, 0 for none"""
+        return max(self.nodes, default=-1) + 1
+
+    @property
+    def branching_factor(self):
+        """Effective branching factor, the growth of the node count per depth"""
+        if len(self.nodes) < 2:
+            return None
+        deepest = max(self.nodes)
+        return (self.nodes[deepest] / self.nodes[min(self.nodes)]) ** (1 / (deepest - min(self.nodes)))
+
+    @property
+    def cutoff_rate(self):
+        return self.cutoffs / self.total_nodes if self.nodes else None
+
+    @property
+    def table_hit_rate(self):
+        return self.table_hits / self.table_lookups if self.table_lookups else None
+
+    def as_dict(self):
+        return {
+            'nodes': {str(depth): count for depth, count in sorted(self.nodes.items())},
+            'evaluations': self.evaluations,
+            'evaluate_calls': self.evaluate_calls,
+            'branching_factor': self.branching_factor,
+            'cutoff_rate': self.cutoff_rate,
+            'table_hit_rate': self.table_hit_rate,
+            'generation_seconds': self.generation_seconds,
+            'evaluation_seconds': self.evaluation_seconds,
+            'seconds': self.seconds,
+        }
+
+    def __str__(self):
+        parts = [f'{self.seconds:.2f}s', f'depth {self.depth}', f'{self.total_nodes} nodes',
+                 f'{self.evaluations} evals in {self.evaluate_calls} calls']
+        if self.branching_factor is not None:
+            parts.append(f'ebf {self.branching_factor:.1f}')
+        if self.cutoff_rate is not None and self.cutoffs:
+            parts.append(f'cutoffs {self.cutoff_rate:.0%}')
+        if self.table_hit_rate is not None:
+            parts.append(f'tt hits {self.table_hit_rate:.0%}')
+        parts.append(f'movegen {self.generation_seconds:.2f}s eval {self.evaluation_seconds:.2f}s')
+        return ', '.join(parts)
+
+
 class Agent:
+    # anytime agents take a deadline keyword in select_move and answer by then
+    anytime = False
+    # an OpeningBook consulted before searching, see amazons/book.py
+    book = None
 
     def __init__(self, name):
         self.name = name
+        # SearchStats the searches add to, search() starts a new one per move
+        self.stats = SearchStats()
 
     def __str__(self):
         return f"Agent {self.name}"
 
-    def select_move(self, board, own):
-        # makes a list of all the pieces we can move
-        potential_pieces = []
-        for x in range(len(board)):
-            for y in range(len(board[0])):
-                if board[y][x] == own and _can_move(board, x, y):
-                    potential_pieces.append([x, y])
-
-        # finds the movements a random piece can make
-        rand = Random()
-        x, y = move_from = rand.choice(potential_pieces)
-        potential_direction = _find_possible_move(board, x, y)
-        x, y = move_to = rand.choice(potential_direction)
-
-        # copies the board to find a random arrow place
-        tmp_board = deepcopy(board)
-        tmp_board[y][x] = Piece.nothing
-        tmp_board[y][x] = own
+    def search(self, board, own, **kwargs):
+        """select_move with fresh statistics, returns (move, evaluation, SearchStats)"""
+        self.stats = SearchStats()
+        start = time.perf_counter()
+        move, evaluation = self.select_move(board, own, **kwargs)
+        self.stats.seconds = time.perf_counter() - start
+        return move, evaluation, self.stats
 
-        potential_arrow = _find_possible_move(tmp_board, x, y)
-        arrow_to = rand.choice(potential_arrow)
+    def known_move(self, board, own):
+        """(move, evaluation) found without searching, here from the opening book, else None"""
+        if self.book is None:
+            return None
+        return self.book.lookup(board, own)
 
-        # moves the piece
-        return (move_from, move_to, arrow_to), 0
+    def select_move(self, board, own):
+        position = BitBoard.from_board(board)
+        return position.random_move(own, Random()), 0
 
 
 class Game:
@@ -63,6 +445,18 @@ class Game:
         self.finished = False
         self.current_player = Player.white
 
+    @property
+    def board(self):
+        return self._board
+
+    @board.setter
+    def board(self, board):
+        self._board = board
+        self.mobility = Mobility(board)
+
+    def position(self):
+        return BitBoard.from_board(self.board)
+
     def _setup(self):
         board = [[Piece.nothing for _ in range(10)] for _ in range(10)]
         board[0][3] = board[0][6] = board[3][0] = board[3][9] = Piece.black_amazon
@@ -71,33 +465,11 @@ class Game:
 
     def is_over(self, player: Player):
         lf = Piece.white_amazon if player == Player.white else Piece.black_amazon
-
-        for y, row in enumerate(self.board):
-            for x, piece in enumerate(row):
-                if piece == lf and self._can_move(x, y):
-                    return False
-        return True
-
-    def _find_possible_move(self, x, y, board=None):
-        """Finds the possible moves allowed from that coordinate"""
-        if board is None:
-            board = self.board
-        possible_movement = []
-        for i in range(-1, 2):
-            for j in range(-1, 2):
-                if i == 0 and j == 0:
-                    continue
-                if y+i < 0 or x+j < 0:
-                    continue
-                if y+i >= len(board) or x+j >= len(board):
-                    continue
-                if board[y+i][x+j] == Piece.nothing:
-                    possible_movement.append([x+j, y+i])
-        return possible_movement, 0
+        return not self.mobility.can_move(lf)
 
     def _can_move(self, x, y):
         # checks if a piece can move
-        return len(self._find_possible_move(x, y)) > 0
+        return self.mobility.mobility(y, x) > 0
 
     def json_format(self):
         board = [[x.value for x in row] for row in self.board]
@@ -161,20 +533,20 @@ class Game:
         valid, reason = _is_valid_move(self.board, move_from, move_to)
         if not valid:
             return MoveState.rejected, "Can't move the amazon that way"
-        # moves the amazon (without saving yet)
-        tmp_board = deepcopy(self.board)
-        tmp_board[y1][x1] = Piece.nothing
-        tmp_board[y2][x2] = piece
+        # moves the amazon (taken back if the arrow is invalid)
+        self.board[y1][x1] = Piece.nothing
+        self.board[y2][x2] = piece
 
         # check if shooting the arrow is valid
-        valid, reason = _is_valid_move(tmp_board, move_to, arrow_to)
+        valid, reason = _is_valid_move(self.board, move_to, arrow_to)
         if not valid:
+            self.board[y2][x2] = Piece.nothing
+            self.board[y1][x1] = piece
             return MoveState.rejected, "Can't shoot the arrow like that"
 
-        # move the piece on the board and shoot the arrow (with saving)
-        self.board[y1][x1] = Piece.nothing
-        self.board[y2][x2] = piece
+        # shoot the arrow
         self.board[y3][x3] = Piece.arrow
+        self.mobility.update(self.board, move)
 
         if self.current_player == Player.white:
             self.current_player = Player.black
@@ -196,16 +568,16 @@ def _is_valid_move(board, move_from, move_to):
     if x1 == x2 and y1 == y2:
         return False, "x and y are the same"
 
-    if abs(y2 - y1) == abs(x2 - x1) or x2-x1 == 0 or y2-y1 == 0:
-        signx = int(copysign(1, x2-x1))
-        if x2-x1 == 0:
-            signx = 0
-        signy = int(copysign(1, y2-y1))
-        if y2-y1 == 0:
-            signy = 0
-        for i in range(1, max(abs(y2-y1), abs(x2-x1))+1):
-            if board[y1+i*signy][x1+i*signx] != Piece.nothing:
-                return False, f"diag: something in the way on {(x1+i*signx, y1+i*signy)}"
+    dy = y2 - y1
+    dx = x2 - x1
+    if abs(dy) == abs(dx) or dx == 0 or dy == 0:
+        steps = max(abs(dy), abs(dx))
+        ray = ray_table(len(board))[y1][x1][DIRECTION_INDEX[((dy > 0) - (dy < 0), (dx > 0) - (dx < 0))]]
+        if len(ray) < steps:
+            return False, "Movement leaves the board"
+        for y, x in ray[:steps]:
+            if board[y][x] != Piece.nothing:
+                return False, f"diag: something in the way on {(x, y)}"
         return True, "correct"
 
     return False, "Invalid movement (not diagonal or straight)"
@@ -213,21 +585,11 @@ def _is_valid_move(board, move_from, move_to):
 def _find_possible_move(board, x, y):
         """Finds the possible moves allowed from that coordinate"""
         possible_movement = []
-        for i in range(-1, 2):
-            for j in range(-1, 2):
-                if i == 0 and j == 0:
-                    continue
-                k = 1
-                while True:
-                    if y+i*k < 0 or x+j*k < 0:
-                        break
-                    if y+i*k >= len(board) or x+j*k >= len(board):
-                        break
-                    if board[y+i*k][x+j*k] == Piece.nothing:
-                        possible_movement.append((y+i*k, x+j*k))
-                    else:
-                        break
-                    k += 1
+        for ray in ray_table(len(board))[y][x]:
+            for square in ray:
+                if board[square[0]][square[1]] != Piece.nothing:
+                    break
+                possible_movement.append(square)
         return possible_movement
 
 def _can_move(board, x, y):
@@ -273,6 +635,62 @@ def arrow_move(board, move):
     return board
 
 
+def apply(board, move):
+    """Plays a queen move (move_from, move_to) or a full move (move_from, move_to, arrow_to) in place.
+
+    Returns the record needed by undo, or None if the move is invalid.
+    An invalid move leaves the board untouched.
+    """
+    if len(move) == 2:
+        move_from, move_to = move
+        arrow_to = None
+    else:
+        move_from, move_to, arrow_to = move
+
+    if queen_move(board, (move_from, move_to)) is None:
+        return None
+
+    if arrow_to is not None and arrow_move(board, (move_to, arrow_to)) is None:
+        undo(board, (move_from, move_to, None))
+        return None
+
+    return move_from, move_to, arrow_to
+
+
+def apply_arrow(board, move):
+    """Shoots an arrow (move_from, arrow_to) in place and returns the undo record"""
+    move_from, arrow_to = move
+    if arrow_move(board, (move_from, arrow_to)) is None:
+        return None
+    return None, None, arrow_to
+
+
+def undo(board, record):
+    """Reverts a move made by apply or apply_arrow"""
+    move_from, move_to, arrow_to = record
+
+    # the arrow has to go first, it may have been shot onto move_from
+    if arrow_to is not None:
+        board[arrow_to[0]][arrow_to[1]] = Piece.nothing
+
+    if move_from is not None:
+        y1, x1 = move_from
+        y2, x2 = move_to
+        board[y1][x1] = board[y2][x2]
+        board[y2][x2] = Piece.nothing
+
+
+def pack_board(board):
+    """Serializes the board into one byte per square, row by row"""
+    return bytes(piece.value for row in board for piece in row)
+
+
+def unpack_board(data):
+    """Rebuilds a board serialized by pack_board"""
+    size = isqrt(len(data))
+    return [[Piece(data[y*size + x]) for x in range(size)] for y in range(size)]
+
+
 def move(board, move):
     """Handles the movement of a piece and its arrow"""
 
@@ -0,0 +1,25 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+
+def context():
+    """Forks where possible, so workers inherit lambdas and other unpicklable state"""
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()
+
+
+# what the creator of the pool handed to this worker process by name, set by _init_worker
+worker = {}
+
+
+def _init_worker(values):
+    worker.update(values)
+
+
+def pool(workers, **values):
+    """A ProcessPoolExecutor whose worker processes find the keyword arguments in worker.
+
+    Where processes are spawned instead of forked the values have to be picklable.
+    """
+    return ProcessPoolExecutor(workers, mp_context=context(), initializer=_init_worker, initargs=(values,))
@@ -0,0 +1 @@
+amazons/amazons_rust/target/debug/amazons_rust --serve
@@ -0,0 +1,206 @@
+from concurrent.futures import as_completed
+import itertools
+import json
+import math
+import random
+import time
+
+from amazons.game import *
+from amazons.agents import *
+from amazons import processes
+
+
+# the configurations of run_script.py, the time-limited agents with a shorter limit
+AGENTS = {
+    'Terror': lambda: Terror("Terror", lambda d: 1/min(d, 3), -0.2),
+    'DeepTerror Alpha': lambda: DeepTerror("DeepTerror Alpha", lambda d: 1/min(d, 3), -0.2, 10, 10, 7, 2),
+    'DeepTerror Wide': lambda: DeepTerror("DeepTerror Wide", lambda d: 1/min(d, 3), -0.2, 7, 7, 20, 2),
+    'DeepTerror Shiv': lambda: DeepTerror("DeepTerror Shiv", lambda d: 1/min(d, 3), -0.2, 7, 7, 4, 2),
+    'DeepTerror Knife': lambda: DeepTerror("DeepTerror Knife", lambda d: 1/min(d, 3), -0.2, 5, 5, 6, 2),
+    'FreeTerror': lambda: FreeTerror("FreeTerror", lambda d: 1/min(d, 3), -0.2, 2,
+                                     lambda p, r: min(5, int(math.sqrt(p))), 700),
+    'FreeTerror Shiv': lambda: FreeTerror("FreeTerror Shiv", lambda d: 1/min(d, 3), -0.2, 2,
+                                          lambda p, r: min(max(1, 4-r), int(math.sqrt(p))), 240),
+    'AlphaTerror': lambda: AlphaTerror("AlphaTerror", lambda d: 1/min(d, 3), -0.2, 6, 2, time_limit=2),
+    'MonteTerror': lambda: MonteTerror("MonteTerror", lambda d: 1/min(d, 3), -0.2, 6, 2, time_limit=2),
+    'Random': lambda: Random("Random"),
+}
+
+
+def play_game(white, black, opening_plies=0, seed=0):
+    """Plays one game between two agents after opening_plies random moves.
+
+    Returns a dict with the winning color, the number of plies and per color
+    the wall and CPU seconds, evaluated positions and search depth of every
+    move it chose.
+    An agent that answers with an illegal move loses the game.
+    """
+    rand = random.Random(seed)
+    random.seed(seed)
+    game = Game()
+    stats = {'white': [], 'black': []}
+
+    for _ in range(opening_plies):
+        own = Piece.white_amazon if game.current_player == Player.white else Piece.black_amazon
+        move = game.position().random_move(own, rand)
+        if move is None or game.move(move)[0] == MoveState.game_over:
+            break
+
+    winner = None
+    plies = opening_plies
+    while not game.finished:
+        color = 'white' if game.current_player == Player.white else 'black'
+        agent = white if color == 'white' else black
+        own = Piece.white_amazon if color == 'white' else Piece.black_amazon
+
+        cpu = time.process_time()
+        move, _, search = agent.search(game.board, own)
+        stats[color].append({
+            'seconds': search.seconds,
+            'cpu': time.process_time() - cpu,
+            'evaluations': search.evaluations,
+            'depth': search.depth,
+        })
+
+        state, reason = game.move(move) if move is not None else (MoveState.rejected, 'No move')
+        plies += 1
+        if state == MoveState.rejected:
+            winner = 'black' if color == 'white' else 'white'
+            break
+        if state == MoveState.game_over:
+            winner = color
+
+    if winner is None:
+        # the random opening already ended the game, the side to move lost
+        winner = 'black' if game.current_player == Player.white else 'white'
+    return {'winner': winner, 'plies': plies, 'moves': stats}
+
+
+def _tournament_game(white, black, opening_plies, seed):
+    agents = processes.worker['agents']
+    result = play_game(agents[white](), agents[black](), opening_plies, seed)
+    result.update({'white': white, 'black': black, 'opening_plies': opening_plies, 'seed': seed})
+    return result
+
+
+def schedule(names, openings, opening_plies, seed=0):
+    """Every pair of agents plays every opening once with each color"""
+    rand = random.Random(seed)
+    tasks = []
+    for first, second in itertools.combinations(names, 2):
+        for _ in range(openings):
+            game_seed = rand.getrandbits(32)
+            tasks.append((first, second, opening_plies, game_seed))
+            tasks.append((second, first, opening_plies, game_seed))
+    return tasks
+
+
+def run(agents, names, openings, opening_plies=4, workers=1, path=None, seed=0, progress=None):
+    """Plays the schedule in a process pool and returns the game results.
+
+    Every finished game is appended to path as a JSON line right away, so an
+    interrupted tournament keeps what it played and results of several runs
+    can be rated together. progress(done, total, result) is called per game.
+    """
+    tasks = schedule(names, openings, opening_plies, seed)
+
+    results = []
+    with processes.pool(workers, agents=agents) as pool:
+        futures = [pool.submit(_tournament_game, *task) for task in tasks]
+        for done, future in enumerate(as_completed(futures)):
+            result = future.result()
+            results.append(result)
+            if path is not None:
+                with open(path, 'a') as file:
+                    file.write(json.dumps(result) + '\n')
+            if progress is not None:
+                progress(done + 1, len(tasks), result)
+    return results
+
+
+def load_results(path):
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def _ratings(games, names):
+    """Bradley-Terry ratings in Elo, mean 0, with a virtual draw against every opponent"""
+    wins = {name: 0.5 * (len(names) - 1) for name in names}
+    # games between each pair, counted under both orders
+    played = {pair: 1 for pair in itertools.permutations(names, 2)}
+    for game in games:
+        winner = game[game['winner']]
+        wins[winner] += 1
+        played[(game['white'], game['black'])] += 1
+        played[(game['black'], game['white'])] += 1
+
+    strength = {name: 1.0 for name in names}
+    for _ in range(200):
+        new = {}
+        for name in names:
+            total = sum(played[(name, other)] / (strength[name] + strength[other]) for other in names if other != name)
+            new[name] = wins[name] / total
+        mean = math.exp(sum(math.log(value) for value in new.values()) / len(new))
+        strength = {name: value / mean for name, value in new.items()}
+
+    return {name: 400 * math.log10(value) for name, value in strength.items()}
+
+
+def elo(games, names=None, bootstrap=200, seed=0):
+    """{name: (elo, low, high)} with a 95% interval from resampling the games"""
+    if names is None:
+        names = sorted({game['white'] for game in games} | {game['black'] for game in games})
+    ratings = _ratings(games, names)
+    rand = random.Random(seed)
+    samples = {name: [] for name in names}
+    for _ in range(bootstrap):
+        resampled = _ratings([rand.choice(games) for _ in games], names)
+        for name in names:
+            samples[name].append(resampled[name])
+
+    result = {}
+    for name in names:
+        values = sorted(samples[name])
+        low = values[int(0.025 * len(values))] if values else ratings[name]
+        high = values[int(0.975 * len(values)) - 1] if values else ratings[name]
+        result[name] = (ratings[name], low, high)
+    return result
+
+
+def move_stats(games):
+    """Per agent: moves, mean and p95 seconds per move, mean positions evaluated per move and total CPU seconds"""
+    moves = {}
+    for game in games:
+        for color in ('white', 'black'):
+            moves.setdefault(game[color], []).extend(game['moves'][color])
+
+    stats = {}
+    for name, agent_moves in moves.items():
+        seconds = sorted(move['seconds'] for move in agent_moves)
+        count = len(seconds)
+        stats[name] = {
+            'moves': count,
+            'mean_seconds': sum(seconds) / count if count else 0.0,
+            'p95_seconds': seconds[min(count - 1, math.ceil(0.95 * count) - 1)] if count else 0.0,
+            'mean_evaluations': sum(move['evaluations'] for move in agent_moves) / count if count else 0.0,
+            'cpu_seconds': sum(move['cpu'] for move in agent_moves),
+        }
+    return stats
+
+
+def report(games):
+    ratings = elo(games)
+    stats = move_stats(games)
+    scores = {name: [0, 0] for name in ratings}
+    for game in games:
+        scores[game[game['winner']]][0] += 1
+        scores[game['white']][1] += 1
+        scores[game['black']][1] += 1
+
+    lines = [f"{'agent':<20} {'elo':>6} {'95% interval':>16} {'score':>9} {'s/move':>8} {'p95':>8} {'evals/move':>11} {'cpu s':>9}"]
+    for name, (rating, low, high) in sorted(ratings.items(), key=lambda item: -item[1][0]):
+        s = stats.get(name, {'mean_seconds': 0, 'p95_seconds': 0, 'mean_evaluations': 0, 'cpu_seconds': 0})
+        won, played = scores[name]
+        lines.append(f"{name:<20} {rating:6.0f} {f'[{low:.0f}, {high:.0f}]':>16} {f'{won}/{played}':>9} "
+                     f"{s['mean_seconds']:8.2f} {s['p95_seconds']:8.2f} {s['mean_evaluations']:11.0f} {s['cpu_seconds']:9.1f}")
+    return lines
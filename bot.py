@@ -20,6 +20,8 @@ bot = commands.Bot(command_prefix=discord_config['prefix'], intents=intents)
 
 logging.basicConfig(handlers=[logging.FileHandler('bot.log', 'a', encoding='utf-8')],
                     format='%(asctime)s - %(levelname)s - %(message)s')
+# the search statistics of the amazons engine, without discord.py's INFO output
+logging.getLogger('amazons').setLevel(logging.INFO)
 
 
 @bot.event
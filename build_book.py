@@ -0,0 +1,23 @@
+import argparse
+import os
+
+from amazons.game import *
+from amazons.agents import *
+from amazons import book
+
+parser = argparse.ArgumentParser(description='Builds the opening book of the amazons bot')
+parser.add_argument('--output', default=os.path.join('amazons', 'opening_book.bin'))
+parser.add_argument('--plies', type=int, default=3)
+parser.add_argument('--width', type=int, default=6)
+parser.add_argument('--workers', type=int, default=os.cpu_count())
+parser.add_argument('--time-limit', type=float, default=60.0)
+args = parser.parse_args()
+
+# a deep AlphaTerror search per position, the book is built once and used in every game
+ai = AlphaTerror("AlphaTerror Book", lambda d: 1/min(d, 3), -0.2, 8, 3, time_limit=args.time_limit)
+
+game = Game()
+opening_book = book.build(ai, game.board, Piece.white_amazon, args.plies, args.width, args.workers,
+                          progress=lambda ply, done, total: print(f'ply {ply + 1}: {done}/{total}', flush=True))
+opening_book.write(args.output)
+print(f'{len(opening_book)} positions written to {args.output}')
@@ -1,17 +1,49 @@
 from dis import disco
 import discord
+import os
 import random
 import time
 import json
-import subprocess
 from discord.ext import tasks, commands
 
-from amazons import game, agents
+import util
+from amazons import game, agents, engine, book
+
+config = util.discord_config
 
 class AmazonsCog(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
+        amazons_config = config.get('amazons', {})
+        command = amazons_config.get('engine', ['wsl', './/amazons//run_amazons_rust_engine.sh'])
+        # 'rust' asks the engine process and falls back to the Python agent, 'python' only uses the agent
+        self.backend = amazons_config.get('backend', 'rust')
+        # adds the search statistics of the Python agent to the move comments
+        self.show_stats = amazons_config.get('show_stats', False)
+        seconds_per_move = amazons_config.get('seconds_per_move', 10.0)
+        # an anytime agent, so the scheduler's deadline bounds every move; time_limit only applies without one
+        self.agent_name = "AlphaTerror"
+        agent = agents.AlphaTerror(self.agent_name, lambda d: 1/min(d, 3), -0.2, 6, 2, time_limit=seconds_per_move)
+        # built by build_book.py, the bot plays without one if it hasn't been built
+        book_path = amazons_config.get('book', os.path.join('amazons', 'opening_book.bin'))
+        self.book = book.OpeningBook.load(book_path) if os.path.exists(book_path) else None
+        agent.book = self.book
+        workers = amazons_config.get('workers', 2)
+        self.service = engine.MoveService({self.agent_name: agent}, workers=workers)
+        self.engine = engine.EngineWorker(command, fallback=self.python_move)
+        # the one engine process answers one move at a time, the service as many as it has workers
+        self.scheduler = engine.GameScheduler(
+            slots=workers if self.backend == 'python' else 1,
+            nodes_per_move=amazons_config.get('nodes_per_move', 10_000),
+            seconds_per_move=seconds_per_move)
+
+    async def cog_unload(self):
+        await self.engine.stop()
+        await self.service.shutdown()
+
+    async def python_move(self, game_id, turn, board_data, deadline=None):
+        return await self.service.move_line(game_id, self.agent_name, turn, board_data, deadline, self.show_stats)
 
     @commands.Cog.listener()
     async def on_message(self, msg : discord.Message):
@@ -30,36 +62,32 @@ class AmazonsCog(commands.Cog):
 
         game_id = game_data['id']
 
-        '''
-        if game_data['turn'] == game.Player.white.value:
-            own = game.Piece.white_amazon
-        else:
-            own = game.Piece.black_amazon
-
-        board_data = game_data['board']
+        # a new position makes older searches of this game pointless
+        self.service.cancel_game(game_id)
+        if engine.is_over(game_data['turn'], game_data['board']):
+            self.scheduler.finish(game_id)
+            return
 
-        board = []
-        for row in board_data:
-            board.append([])
-            for column in row:
-                piece = game.Piece(column)
-                board[-1].append(piece)
-        ai = agents.DeepTerror("DeepTerror Knife", lambda d: 1/min(d, 3), -0.2, 5, 5, 6, 2)
-        move, value = ai.select_move(board, own)
+        if self.book is not None:
+            booked = self.book.lookup(engine.board_from_data(game_data['board']), engine.own_piece(game_data['turn']))
+            if booked is not None:
+                await msg.channel.send(f'<@963682692732428330> play {game_id} {engine.format_move(*booked)}')
+                return
 
-         (start_y, start_x), (move_y, move_x), (shoot_y, shoot_x) = move
+        async def compute(max_count, deadline):
+            if self.backend == 'python':
+                return await self.python_move(game_id, game_data['turn'], game_data['board'], deadline)
+            return await self.engine.select_move(game_data['turn'], game_data['board'], game_id, max_count, deadline)
 
-        comment = f'Response by AI ``{ai.name}``\nBoard State Evaluation: {value}'
-        move_string = f'<@963682692732428330>|play|{game_id}|{start_x},{start_y}|{move_x},{move_y}|{shoot_x},{shoot_y}|{comment}'
-        '''
-        
-        input_string = str(game_data['turn']) + ' ' + str(game_data['board'])
-        with open('amazons/input.txt', 'w') as f:
-            f.write(input_string)
+        try:
+            output = await self.scheduler.run(game_id, game_data['board'], compute)
+        except engine.GameCancelled:
+            return
+        except engine.ServiceBusy as e:
+            # the embed helpers only read the author, which the message has too
+            await msg.channel.send(embed=util.error_embed(msg, f'Too many games are waiting for a move, try again later. ({e})'))
+            return
 
-        subproc = subprocess.run(['wsl', './/amazons//run_amazons_rust_build.sh'], capture_output=True)
-        output = subproc.stdout.decode('utf-8')
-        
         move_string = f'<@963682692732428330> play {game_id} {output}'
         await msg.channel.send(move_string)
         
@@ -68,6 +96,10 @@ class AmazonsCog(commands.Cog):
     async def amazon_start(self, ctx, opponent : str):
         await ctx.send(f'<@963682692732428330> start {opponent}')
 
+    @commands.command()
+    async def amazon_status(self, ctx):
+        await ctx.send(str(self.scheduler))
+
 
 async def setup(bot: commands.Bot):
     await bot.add_cog(AmazonsCog(bot))
\ No newline at end of file
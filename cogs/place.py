@@ -1,7 +1,10 @@
+import asyncio
 import discord
-import random
+import logging
 import time
+from collections import deque
 from discord.ext import tasks, commands
+import numpy as np
 from PIL import Image
 
 import util
@@ -9,38 +12,175 @@ import database as db
 
 config = util.discord_config
 
+
+def _grid_distance(xs, ys):
+    """Distance of every pixel to the lines of the 10 pixel grid"""
+    return np.minimum(xs % 10, ys % 10).astype(np.uint8)
+
+
+def _fill_grid_rank(xs, ys):
+    """The grid lines first, then the rest of every cell, spread over 3x3 blocks of cells.
+
+    This is the order of the old (x / 10) % 3 key in exact arithmetic. The old
+    key used floats, whose rounding broke most of its ties, so at most
+    positions it drew a different pixel than this order does.
+    """
+    distance = _grid_distance(xs, ys)
+    phase = np.where(distance < 4, distance, 10).astype(np.uint16)
+    return phase * 900 + (xs % 30).astype(np.uint16) * 30 + (ys % 30).astype(np.uint16)
+
+
+# lexsort keys of the drawing orders, the last key sorts first and ties keep
+# the column by column order the pixels are read in. The keys are kept to 16
+# bits or less, which numpy sorts in linear time.
+ORDERS = {
+    'id': lambda xs, ys, colors: (),
+    'mod': lambda xs, ys, colors: (_grid_distance(xs, ys),),
+    'grid': lambda xs, ys, colors: (_grid_distance(xs, ys),),
+    'color': lambda xs, ys, colors: ((colors & 0xffff).astype(np.uint16), (colors >> 16).astype(np.uint8)),
+    'random': lambda xs, ys, colors: tuple(np.random.default_rng().integers(0, 2**16, (2, len(xs)), dtype=np.uint16)),
+    'fill-grid': lambda xs, ys, colors: (_fill_grid_rank(xs, ys),),
+}
+
+
+def ordered_pixels(image, order):
+    """The opaque pixels of an RGBA image array in drawing order.
+
+    Returns the columns xs, ys and colors, the colors as 24-bit RGB integers.
+    """
+    # transposed, so the pixels are read column by column
+    xs, ys = np.nonzero(image[:, :, 3].T >= 255)
+    rgb = image[ys, xs, :3].astype(np.uint32)
+    colors = (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+
+    keys = ORDERS[order](xs, ys, colors)
+    if keys:
+        rank = np.lexsort(keys)
+        xs, ys, colors = xs[rank], ys[rank], colors[rank]
+    return xs, ys, colors
+
+
+_HEX_DIGITS = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+
+
+def hex_colors(colors):
+    """24-bit colors as '#rrggbb' byte strings, formatted for the whole column at once"""
+    chars = np.empty((len(colors), 7), dtype=np.uint8)
+    chars[:, 0] = ord('#')
+    for i in range(6):
+        chars[:, i + 1] = _HEX_DIGITS[(colors >> (20 - 4 * i)) & 0xf]
+    return chars.view('S7').ravel()
+
+
+def read_image(path, order):
+    return ordered_pixels(np.asarray(Image.open(path).convert('RGBA')), order)
+
 class PlaceCog(commands.Cog):
+    """Places the pixels of the projects, rate of them per minute.
+
+    Every tick claims the next pixels from the database into a queue, sends
+    them and writes the placed pixels and the progress of their projects back
+    in one transaction. Pixels only leave the database (or the cursor of a
+    packed project only moves) once they are written back, so after a restart
+    the queue is claimed again and at most the pixels of the last unwritten
+    tick are placed twice, also when that write back failed.
+    """
 
     def __init__(self, bot):
         self.bot = bot
         self.placing = False
         self.rate = 30
+        # new projects are stored 'packed' as one blob, or as 'rows' of PlacePixels
+        self.storage = config['place'].get('storage', 'packed')
+        self.channel = None
+        # claimed pixels not sent yet, in drawing order
+        self.queue = deque()
+        # last seq claimed per project, the next claim continues after it
+        self.claimed = {}
+        # sent pixels and placed counts per project not written back yet
+        self.sent = []
+        self.placed = {}
 
     def cog_unload(self):
         self.placing = False
         self.place_pixel.cancel()
 
+    def get_channel(self):
+        if self.channel is None:
+            guild = self.bot.get_guild(config['place']['guild'])
+            if guild is not None:
+                self.channel = guild.get_channel(config['place']['channel'])
+        return self.channel
+
+    def claim(self):
+        """Tops the queue up to two ticks of pixels, so the next tick is ready too.
+
+        Projects are drawn one after another by priority, each in its own order.
+        """
+        missing = 2 * int(self.rate) - len(self.queue)
+        if missing <= 0:
+            return
+        projects = db.PlaceProject.get_all()
+        # finished and removed projects are gone, a new project under their name starts over
+        names = {project.name for project in projects}
+        self.claimed = {name: seq for name, seq in self.claimed.items() if name in names}
+        for project in projects:
+            if project.packed:
+                # placed is the cursor of a packed project, everything before it is written back
+                pixels = db.PlacePixel.claim_packed(project, missing, self.claimed.get(project.name, project.placed - 1))
+            else:
+                pixels = db.PlacePixel.claim(project.name, missing, self.claimed.get(project.name, -1))
+            self.queue.extend(pixels)
+            if pixels:
+                self.claimed[project.name] = pixels[-1].seq
+            missing -= len(pixels)
+            if missing <= 0:
+                break
+
+    def write_back(self):
+        if not self.placed:
+            return
+        db.PlaceProject.record_placed(self.placed, self.sent)
+        self.sent = []
+        self.placed = {}
+
     @tasks.loop(seconds=60)
     async def place_pixel(self):
-        for i in range(int(self.rate)):
-            pixel = db.PlacePixel.get_random()
-            if pixel is None:
-                return
-            project = db.PlaceProject.get_by_name(pixel.project)
-            
-            guild = self.bot.get_guild(config['place']['guild'])
-            channel = guild.get_channel(config['place']['channel'])
+        channel = self.get_channel()
+        if channel is None:
+            return
 
-            try:
-                await channel.send(f'.place setpixel {pixel.x} {pixel.y} {pixel.color}')
-                project.placed += 1
-                if project.placed >= project.total:
-                    project.delete()
-                else:
-                    project.update()
-                pixel.delete()
-            except Exception as e:
-                pass
+        self.claim()
+        try:
+            for i in range(int(self.rate)):
+                if not self.queue:
+                    break
+                pixel = self.queue[0]
+                try:
+                    await channel.send(f'.place setpixel {pixel.x} {pixel.y} {pixel.color}')
+                except Exception as e:
+                    # the pixel stays first in the queue for the next tick
+                    logging.error(f'Placing pixel failed: {e}')
+                    break
+                self.queue.popleft()
+                if pixel.id is not None:
+                    self.sent.append(pixel.id)
+                self.placed[pixel.project] = self.placed.get(pixel.project, 0) + 1
+        finally:
+            self.write_back()
+
+    @place_pixel.after_loop
+    async def place_pixel_stopped(self):
+        # the queue is claimed again on the next start, so removed projects and new pixels are seen
+        try:
+            self.write_back()
+        finally:
+            # pixels that couldn't be written back are claimed again from the database's
+            # cursors, so their counts go too and they are placed twice, like an unwritten tick
+            self.queue.clear()
+            self.claimed = {}
+            self.sent = []
+            self.placed = {}
 
 
     @commands.group(name='place')
@@ -50,7 +190,8 @@ class PlaceCog(commands.Cog):
 Rate: ``{self.rate}/min``''')
             projects = db.PlaceProject.get_all()
             for project in projects:
-                embed.add_field(name=f'Project: {project.name}', value=f'Placed: {project.placed}/{project.total}')
+                placed = project.placed + self.placed.get(project.name, 0)
+                embed.add_field(name=f'Project: {project.name}', value=f'Placed: {placed}/{project.total}')
             await util.send_embed(ctx, embed)
 
     @commands.check(util.is_owner)
@@ -82,72 +223,59 @@ Rate: ``{self.rate}/min``''')
 
     @commands.check(util.is_owner)
     @place.group(name='project')
-    async def place_project_add(self, ctx, name: str, x: int, y: int, order='fill-grid'):
+    async def place_project_add(self, ctx, name: str, x: int, y: int, order='fill-grid', priority: int = 0):
+        if order not in ORDERS:
+            await util.send_embed(ctx, util.error_embed(ctx, f'Order must be one of {", ".join(ORDERS)}.'))
+            return
         await ctx.message.attachments[0].save('data/temp.png')
-        file = Image.open('data/temp.png')
-        width, height = file.size
-
-        def rgb_to_hex(rgb):
-            return '#%02x%02x%02x' % rgb
-
-        orders = {
-            'id':lambda p: p,
-            'mod': lambda p: min(p[0] % 10, p[1] % 10),
-            'grid': lambda p: min(p[0] % 10, p[1] % 10),
-            'color': lambda p: p[2],
-            'random': lambda p: random.random(),
-            'fill-grid': lambda p: (min(p[0] % 10, p[1] % 10) if min(p[0] % 10, p[1] % 10) < 4 else 10, ((p[0] / 10) % 3, (p[1] / 10) % 3), (p[0] / 10, p[1] / 10), min(p[0] % 10, p[1] % 10))
-        }
-        sort = orders[order]
-
-        update_embed = util.success_embed(ctx, f'Reading Pixels... [0/{width*height}]')
-        update_msg = await ctx.send(embed=update_embed)
-        last_update = time.time()
 
-        pixels = []
-        for i in range(width):
-            for j in range(height):
-                rgb = file.getpixel((i, j))
-                if rgb[3] >= 255:
-                    pixels.append((i, j, rgb))
-
-            if time.time() - last_update > 3:
-                last_update = time.time()
-                update_embed = util.success_embed(ctx, f'Reading Pixels... [{i*width + j}/{width*height}]')
-                await update_msg.edit(embed=update_embed)
-
-        last_update = time.time()
-        update_embed = util.success_embed(ctx, f'Sorting Pixels...')
-        await update_msg.edit(embed=update_embed)
+        update_embed = util.success_embed(ctx, f'Reading Pixels...')
+        update_msg = await ctx.send(embed=update_embed)
+        xs, ys, colors = await asyncio.to_thread(read_image, 'data/temp.png', order)
+        xs += x
+        ys += y
+        pixels = len(xs)
 
-        pixels.sort(key=sort)
+        if self.storage == 'packed' and pixels > 0 and (min(xs.min(), ys.min()) < 0 or max(xs.max(), ys.max()) > 0xffff):
+            await update_msg.delete()
+            await util.send_embed(ctx, util.error_embed(ctx, 'Packed projects need coordinates between 0 and 65535.'))
+            return
 
         last_update = time.time()
-        update_embed = util.success_embed(ctx, f'Inserting into database... [0/{len(pixels)}]')
+        update_embed = util.success_embed(ctx, f'Inserting into database... [0/{pixels}]')
         await update_msg.edit(embed=update_embed)
 
+        if self.storage == 'packed':
+            project = db.PlaceProject(name, pixels, 0, priority)
+            data = await asyncio.to_thread(db.pack_pixels, xs, ys, colors)
+            await asyncio.to_thread(project.insert_packed, data)
+        else:
+            loop = asyncio.get_running_loop()
 
-        project = db.PlaceProject(name, len(pixels), 0)
-        project.insert()
-        project = db.PlaceProject.get_by_name(name)
-
-        pixel_objects = []
-        for n, (i, j, color) in enumerate(pixels):
-            color_string = rgb_to_hex((color[0], color[1], color[2]))
-            pixel = db.PlacePixel(0, project.name, x+i, y+j, color_string)
-            pixel_objects.append(pixel)
+            # called from the loading thread after every chunk
+            def progress(done, total):
+                nonlocal last_update
+                if time.time() - last_update > 3:
+                    last_update = time.time()
+                    update_embed = util.success_embed(ctx, f'Inserting into database... [{done}/{total}]')
+                    asyncio.run_coroutine_threadsafe(update_msg.edit(embed=update_embed), loop)
 
-            if time.time() - last_update > 3:
-                last_update = time.time()
-                update_embed = util.success_embed(ctx, f'Inserting into database... [{n}/{len(pixels)}]')
-                await update_msg.edit(embed=update_embed)
-
-        db.PlacePixel.insert_pixels(pixel_objects)
+            project = db.PlaceProject(name, pixels, 0, priority)
+            project.insert()
+            try:
+                await asyncio.to_thread(db.PlacePixel.copy_pixels, project.name, xs, ys, hex_colors(colors),
+                                        progress=progress)
+            except Exception:
+                # a project without its pixels would count as never finished
+                project.delete()
+                raise
 
+        # a finished project of the same name may have left its claim cursor behind
+        self.claimed.pop(name, None)
         await update_msg.delete()
         await util.send_embed(ctx, util.success_embed(ctx,
 f'''Successfully generated project ``{name}``.
-Pixels: {len(pixels)}
+Pixels: {pixels}
 Coolness: 11/10'''
         ))
 
@@ -160,6 +288,9 @@ Coolness: 11/10'''
             return
         
         project.delete()
+        self.queue = deque(pixel for pixel in self.queue if pixel.project != name)
+        self.placed.pop(name, None)
+        self.claimed.pop(name, None)
         await util.send_embed(ctx, util.success_embed(ctx, 'Project Successfully deleted'))
 
 async def setup(bot: commands.Bot):
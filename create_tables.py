@@ -1,5 +1,13 @@
+import sys
+
 import database as db
 
+# with --migrate the existing tables are upgraded in place instead of recreated
+if '--migrate' in sys.argv:
+    db.PlaceProject.migrate_table()
+    db.PlacePixel.migrate_table()
+    sys.exit()
+
 db.PlaceProject.delete_table()
 db.PlacePixel.delete_table()
 
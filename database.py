@@ -1,4 +1,5 @@
-from functools import total_ordering
+import io
+import numpy as np
 import psycopg2
 import psycopg2.extras
 from util import parse_config
@@ -15,6 +16,20 @@ def connect():
 
 conn = connect()
 
+# one pixel of a packed project, 7 bytes instead of a PlacePixels row
+PIXEL = np.dtype([('x', '<u2'), ('y', '<u2'), ('r', 'u1'), ('g', 'u1'), ('b', 'u1')])
+
+
+def pack_pixels(xs, ys, colors):
+    """Packs pixel columns, colors as 24-bit integers, into the bytes of a packed project"""
+    pixels = np.empty(len(xs), dtype=PIXEL)
+    pixels['x'] = xs
+    pixels['y'] = ys
+    pixels['r'] = (colors >> 16) & 0xff
+    pixels['g'] = (colors >> 8) & 0xff
+    pixels['b'] = colors & 0xff
+    return pixels.tobytes()
+
 
 class PlaceProject:
 
@@ -24,8 +39,33 @@ class PlaceProject:
             CREATE TABLE IF NOT EXISTS PlaceProjects ( 
             name text PRIMARY KEY,
             total bigint,
-            placed bigint
-        );'''
+            placed bigint,
+            priority int DEFAULT 0,
+            packed boolean DEFAULT false
+        );
+            CREATE TABLE IF NOT EXISTS PlacePackedPixels (
+            project text PRIMARY KEY REFERENCES PlaceProjects(name) ON DELETE CASCADE,
+            pixels bytea
+        );
+            ALTER TABLE PlacePackedPixels ALTER COLUMN pixels SET STORAGE EXTERNAL;'''
+
+        cur = conn.cursor()
+        cur.execute(command)
+        conn.commit()
+        cur.close()
+
+    @staticmethod
+    def migrate_table():
+        """Adds the columns of newer versions to an existing table, keeping its rows"""
+        command = '''
+            ALTER TABLE PlaceProjects ADD COLUMN IF NOT EXISTS priority int DEFAULT 0;
+            ALTER TABLE PlaceProjects ADD COLUMN IF NOT EXISTS packed boolean DEFAULT false;
+            CREATE TABLE IF NOT EXISTS PlacePackedPixels (
+            project text PRIMARY KEY REFERENCES PlaceProjects(name) ON DELETE CASCADE,
+            pixels bytea
+        );
+            ALTER TABLE PlacePackedPixels ALTER COLUMN pixels SET STORAGE EXTERNAL;
+        '''
 
         cur = conn.cursor()
         cur.execute(command)
@@ -35,6 +75,7 @@ class PlaceProject:
     @staticmethod
     def delete_table():
         command = '''
+            DROP TABLE IF EXISTS PlacePackedPixels CASCADE;
             DROP TABLE IF EXISTS PlaceProjects CASCADE;
         '''
 
@@ -43,17 +84,22 @@ class PlaceProject:
         conn.commit()
         cur.close()
 
-    def __init__(self, name, total, placed):
+    def __init__(self, name, total, placed, priority=0, packed=False):
         self.name = name
         self.total = total
+        # for packed projects also the index of the next pixel to place
         self.placed = placed
+        # projects with a lower priority are drawn first
+        self.priority = priority
+        # the pixels are one PIXEL blob in PlacePackedPixels instead of PlacePixels rows
+        self.packed = packed
 
     @staticmethod
     def create_from_row(row):
         if row is None:
             return None
-        name, total, placed = row
-        return PlaceProject(name, total, placed)
+        name, total, placed, priority, packed = row
+        return PlaceProject(name, total, placed, priority, packed)
 
     @staticmethod
     def get_by_name(name):
@@ -71,7 +117,7 @@ class PlaceProject:
     @staticmethod
     def get_all():
         cur = conn.cursor()
-        command = '''SELECT * FROM PlaceProjects;'''
+        command = '''SELECT * FROM PlaceProjects ORDER BY priority, name;'''
         cur.execute(command)
         rows = cur.fetchall()
         cur.close()
@@ -83,25 +129,65 @@ class PlaceProject:
         command = '''INSERT INTO PlaceProjects(
         name,
         total,
-        placed
+        placed,
+        priority,
+        packed
         ) 
-        VALUES (%s, %s, %s);'''
+        VALUES (%s, %s, %s, %s, %s);'''
 
         cur.execute(command,
         (
         self.name,
         self.total,
-        self.placed
+        self.placed,
+        self.priority,
+        self.packed
         ))
 
         conn.commit()
         cur.close()
 
+    def insert_packed(self, data):
+        """Inserts the project together with its pixels, data as made by pack_pixels.
+
+        Both go in one transaction on its own connection, so it can run in a
+        thread next to the bot's queries.
+        """
+        self.packed = True
+        insert_project = '''INSERT INTO PlaceProjects(name, total, placed, priority, packed)
+        VALUES (%s, %s, %s, %s, %s);'''
+        insert_pixels = '''INSERT INTO PlacePackedPixels(project, pixels) VALUES (%s, %s);'''
+
+        insert_conn = connect()
+        try:
+            with insert_conn:
+                with insert_conn.cursor() as cur:
+                    cur.execute(insert_project, (self.name, self.total, self.placed, self.priority, self.packed))
+                    cur.execute(insert_pixels, (self.name, psycopg2.Binary(data)))
+        finally:
+            insert_conn.close()
+
+    def read_packed(self, start, count):
+        """count pixels of a packed project from index start, as a PIXEL array.
+
+        Only that slice is read from the uncompressed blob, and the array is a
+        view of the buffer the database returned.
+        """
+        cur = conn.cursor()
+        command = '''SELECT substring(pixels FROM %s FOR %s) FROM PlacePackedPixels WHERE project = %s'''
+        cur.execute(command, (start * PIXEL.itemsize + 1, count * PIXEL.itemsize, self.name))
+        row = cur.fetchone()
+        cur.close()
+
+        if row is None:
+            return np.zeros(0, dtype=PIXEL)
+        return np.frombuffer(row[0], dtype=PIXEL)
+
     def get_pixels(self):
         cur = conn.cursor()
-        command = '''SELECT * FROM PlacePixels WHERE project = %s'''
+        command = '''SELECT * FROM PlacePixels WHERE project = %s ORDER BY seq'''
 
-        cur.execute(command, (self.id,))
+        cur.execute(command, (self.name,))
         rows = cur.fetchall()
         cur.close()
 
@@ -112,7 +198,9 @@ class PlaceProject:
         command = '''UPDATE PlaceProjects
         SET
         total = %s,
-        placed = %s
+        placed = %s,
+        priority = %s,
+        packed = %s
         WHERE name = %s
         '''
 
@@ -120,6 +208,8 @@ class PlaceProject:
         (
         self.total,
         self.placed,
+        self.priority,
+        self.packed,
         self.name
         ))
 
@@ -133,6 +223,28 @@ class PlaceProject:
         conn.commit()
         cur.close()
 
+    @staticmethod
+    def record_placed(placed, pixel_ids):
+        """Writes back a batch of placed pixels in one transaction.
+
+        placed maps project names to the pixels placed since the last write,
+        pixel_ids are the ids of those pixels that are PlacePixels rows. For
+        packed projects the placed count alone moves the cursor. Projects that
+        are complete afterwards are deleted. Nothing is written if any
+        statement fails.
+        """
+        delete_pixels = '''DELETE FROM PlacePixels WHERE id = ANY(%s)'''
+        update_projects = '''UPDATE PlaceProjects SET placed = placed + %s WHERE name = %s'''
+        delete_projects = '''DELETE FROM PlaceProjects WHERE name = ANY(%s) AND placed >= total'''
+
+        # the connection commits when the block succeeds and rolls back when it raises
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(delete_pixels, (list(pixel_ids),))
+                psycopg2.extras.execute_batch(cur, update_projects,
+                                              [(count, name) for name, count in placed.items()])
+                cur.execute(delete_projects, (list(placed),))
+
 
 class PlacePixel:
 
@@ -144,8 +256,26 @@ class PlacePixel:
             project text REFERENCES PlaceProjects(name) ON DELETE CASCADE,
             x int,
             y int,
-            color text
-        );'''
+            color text,
+            seq bigint
+        );
+            CREATE UNIQUE INDEX IF NOT EXISTS PlacePixels_project_seq ON PlacePixels(project, seq);'''
+
+        cur = conn.cursor()
+        cur.execute(command)
+        conn.commit()
+        cur.close()
+
+    @staticmethod
+    def migrate_table():
+        """Adds seq to an existing table, numbering the pixels of each project from 0 in insertion order"""
+        command = '''
+            ALTER TABLE PlacePixels ADD COLUMN IF NOT EXISTS seq bigint;
+            UPDATE PlacePixels SET seq = numbered.seq
+            FROM (SELECT id, row_number() OVER (PARTITION BY project ORDER BY id) - 1 AS seq FROM PlacePixels) AS numbered
+            WHERE PlacePixels.id = numbered.id AND PlacePixels.seq IS NULL;
+            CREATE UNIQUE INDEX IF NOT EXISTS PlacePixels_project_seq ON PlacePixels(project, seq);
+        '''
 
         cur = conn.cursor()
         cur.execute(command)
@@ -163,19 +293,21 @@ class PlacePixel:
         conn.commit()
         cur.close()
 
-    def __init__(self, id, project, x, y, color):
+    def __init__(self, id, project, x, y, color, seq):
         self.id = id
         self.project = project
         self.x = x
         self.y = y
         self.color = color
+        # position of the pixel in the drawing order of its project
+        self.seq = seq
 
     @staticmethod
     def create_from_row(row):
         if row is None:
             return None
-        id, project, x, y, color = row
-        return PlacePixel(id, project, x, y, color)
+        id, project, x, y, color, seq = row
+        return PlacePixel(id, project, x, y, color, seq)
 
     @staticmethod
     def get(id):
@@ -191,44 +323,63 @@ class PlacePixel:
         return PlacePixel.create_from_row(row)
 
     @staticmethod
-    def get_random():
+    def claim(project, count, after=-1):
+        """The next count pixels of project with a seq above after, in drawing order.
+
+        Walks the (project, seq) index, so it costs the same however many
+        pixels are left. No rows are locked: the pixels stay in the table until
+        record_placed deletes them, and it is the caller's after cursor, the
+        last seq it claimed, that keeps the same pixels from being claimed twice.
+        """
         cur = conn.cursor()
-        command = '''SELECT * FROM PlacePixels'''
-        cur.execute(command)
-        row = cur.fetchone()
+        command = '''SELECT * FROM PlacePixels WHERE project = %s AND seq > %s
+        ORDER BY seq LIMIT %s'''
+        cur.execute(command, (project, after, count))
+        rows = cur.fetchall()
         cur.close()
 
-        if row is None:
-            return None
-
-        return PlacePixel.create_from_row(row)
+        return [PlacePixel.create_from_row(row) for row in rows]
 
     @staticmethod
-    def insert_pixels(pixels):
-        cur = conn.cursor()
-        command = '''INSERT INTO PlacePixels(
-        project,
-        x,
-        y,
-        color
-        ) 
-        VALUES (%s, %s, %s, %s);'''
-
-        formatted_pixels = []
-        for p in pixels:
-            formatted_pixels.append(
-                (
-                    p.project,
-                    p.x,
-                    p.y,
-                    p.color
-                )
-            )
-        
-        psycopg2.extras.execute_batch(cur, command, formatted_pixels)
-        conn.commit()
-        cur.close()
+    def claim_packed(project, count, after=-1):
+        """Like claim, for a PlaceProject stored packed, the pixels have no id"""
+        pixels = project.read_packed(after + 1, count)
+        return [PlacePixel(None, project.name, x, y, '#%02x%02x%02x' % (r, g, b), seq)
+                for seq, (x, y, r, g, b) in enumerate(pixels.tolist(), after + 1)]
 
+    @staticmethod
+    def copy_pixels(project, xs, ys, colors, chunk_size=100_000, progress=None):
+        """Bulk loads the pixels of a project with COPY, given as columns in drawing order.
+
+        colors is an array of '#rrggbb' strings (str or bytes), seq is the index
+        in the columns. The rows are formatted and sent chunk_size at a time, so
+        memory stays bounded however large the project is, and
+        progress(done, total) is called after every chunk. Everything is loaded
+        in one transaction on its own connection, so it can run in a thread
+        next to the bot's queries.
+        """
+        command = '''COPY PlacePixels(project, x, y, color, seq) FROM STDIN'''
+        # COPY's text format needs tabs, newlines and backslashes escaped
+        name = project.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+        name = name.encode('utf-8')
+
+        def rows(start, end):
+            for seq, (x, y, color) in enumerate(zip(xs[start:end].tolist(), ys[start:end].tolist(),
+                                                    colors[start:end].astype('S7').tolist()), start):
+                yield b'%s\t%d\t%d\t%s\t%d\n' % (name, x, y, color, seq)
+
+        total = len(xs)
+        copy_conn = connect()
+        try:
+            with copy_conn:
+                with copy_conn.cursor() as cur:
+                    for start in range(0, total, chunk_size):
+                        end = min(total, start + chunk_size)
+                        cur.copy_expert(command, io.BytesIO(b''.join(rows(start, end))))
+                        if progress is not None:
+                            progress(end, total)
+        finally:
+            copy_conn.close()
 
     def insert(self):
         cur = conn.cursor()
@@ -236,16 +387,18 @@ class PlacePixel:
         project,
         x,
         y,
-        color
+        color,
+        seq
         ) 
-        VALUES (%s, %s, %s, %s);'''
+        VALUES (%s, %s, %s, %s, %s);'''
 
         cur.execute(command,
         (
         self.project,
         self.x,
         self.y,
-        self.color
+        self.color,
+        self.seq
         ))
 
         conn.commit()
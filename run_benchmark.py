@@ -0,0 +1,31 @@
+import argparse
+import json
+import sys
+
+from amazons import benchmark
+
+parser = argparse.ArgumentParser(description='Measures the amazons agents on a fixed corpus of positions')
+parser.add_argument('--output', help='JSON file for the results, printed if not given')
+parser.add_argument('--compare', help='earlier results to compare against')
+parser.add_argument('--agents', nargs='*', default=list(benchmark.AGENTS), choices=list(benchmark.AGENTS))
+parser.add_argument('--phases', nargs='*', default=['opening', 'middlegame', 'endgame'])
+parser.add_argument('--perft-depth', type=int, default=1)
+parser.add_argument('--backend', default='numpy')
+parser.add_argument('--seed', type=int, default=0)
+args = parser.parse_args()
+
+positions = [p for p in benchmark.load_corpus() if p['phase'] in args.phases]
+agents = {name: benchmark.AGENTS[name] for name in args.agents}
+report = benchmark.run(positions, agents, args.perft_depth, args.backend, args.seed)
+
+if args.output:
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=1)
+else:
+    json.dump(report, sys.stdout, indent=1)
+    print()
+
+if args.compare:
+    with open(args.compare) as file:
+        for line in benchmark.compare(json.load(file), report):
+            print(line, file=sys.stderr)
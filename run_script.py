@@ -10,10 +10,14 @@ from amazons.agents import *
 # DeepTerror("DeepTerror Knife", lambda d: 1/min(d, 3), -0.2, 5, 5, 6, 2)
 # FreeTerror("FreeTerror", lambda d: 1/min(d, 3), -0.2, 2, lambda p, r: min(5, int(math.sqrt(p))), 700)
 # FreeTerror("FreeTerror Shiv", lambda d: 1/min(d, 3), -0.2, 2, lambda p, r: min(max(1, 4-r), int(math.sqrt(p))), 240)
+# AlphaTerror("AlphaTerror", lambda d: 1/min(d, 3), -0.2, 6, 2, time_limit=10)
+# MonteTerror("MonteTerror", lambda d: 1/min(d, 3), -0.2, 6, 2, time_limit=10)
 
 game = Game()
 ai1 = DeepTerror("DeepTerror Knife", lambda d: 1/min(d, 3), -0.2, 5, 5, 6, 2)
 ai2 = DeepTerror("DeepTerror Knife", lambda d: 1/min(d, 3), -0.2, 5, 5, 6, 6)
+ai1.progress = progress_bar()
+ai2.progress = progress_bar()
 
 
 
@@ -22,13 +26,14 @@ ai2 = DeepTerror("DeepTerror Knife", lambda d: 1/min(d, 3), -0.2, 5, 5, 6, 6)
 #game.board[1][1] = Piece.white_amazon
 while not game.finished:
     if game.current_player == Player.white:
-        move, value = ai1.select_move(game.board, Piece.white_amazon)
+        move, value, stats = ai1.search(game.board, Piece.white_amazon)
         game.move(move)
     else:
-        move, value = ai2.select_move(game.board, Piece.black_amazon)
+        move, value, stats = ai2.search(game.board, Piece.black_amazon)
         game.move(move)
     print(game.format(move))
     print(move, value)
+    print(stats)
     print('AI1:', ai1.evaluate(game.board, Piece.white_amazon))
     print('AI2:', ai2.evaluate(game.board, Piece.black_amazon))
     print('-----')
\ No newline at end of file
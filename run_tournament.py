@@ -0,0 +1,29 @@
+import argparse
+import os
+
+from amazons import tournament
+
+parser = argparse.ArgumentParser(description='Plays the amazons agents against each other and rates them')
+parser.add_argument('agents', nargs='*', metavar='agent',
+                    help='agents to play, any of: ' + ', '.join(tournament.AGENTS))
+parser.add_argument('--openings', type=int, default=10, help='openings per pair, each played with both colors')
+parser.add_argument('--opening-plies', type=int, default=4, help='random moves before the agents take over')
+parser.add_argument('--workers', type=int, default=os.cpu_count())
+parser.add_argument('--results', default='tournament_results.jsonl', help='games are appended here')
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--report-only', action='store_true', help='only rate the games already in --results')
+args = parser.parse_args()
+for name in args.agents:
+    if name not in tournament.AGENTS:
+        parser.error(f'unknown agent {name!r}')
+if not args.report_only and len(args.agents) < 2:
+    parser.error('a tournament needs at least two agents')
+
+if not args.report_only:
+    tournament.run(tournament.AGENTS, args.agents, args.openings, args.opening_plies, args.workers, args.results,
+                   args.seed, progress=lambda done, total, result: print(
+                       f"{done}/{total}: {result['white']} - {result['black']}, {result['winner']} won after {result['plies']} plies",
+                       flush=True))
+
+for line in tournament.report(tournament.load_results(args.results)):
+    print(line)
@@ -0,0 +1,96 @@
+import os
+import random
+import shutil
+import sys
+
+import pytest
+
+# the amazons package and the bot's modules are imported from the repository root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from amazons.game import *
+
+
+@pytest.fixture
+def random_board():
+    """Makes boards by playing plies random moves from the starting position"""
+    def make(plies, seed, size=10):
+        rand = random.Random(seed)
+        board = Game().board if size == 10 else _small_board(size)
+        own = Piece.white_amazon
+        for _ in range(plies):
+            move = BitBoard.from_board(board).random_move(own, rand)
+            if move is None:
+                break
+            apply(board, move)
+            own = Piece.black_amazon if own == Piece.white_amazon else Piece.white_amazon
+        return board, own
+    return make
+
+
+def _small_board(size):
+    board = [[Piece.nothing for _ in range(size)] for _ in range(size)]
+    board[0][0] = board[0][size - 1] = Piece.black_amazon
+    board[size - 1][0] = board[size - 1][size - 1] = Piece.white_amazon
+    return board
+
+
+class FakeConnection:
+    """Stands in for the psycopg2 connection, keeping the packed pixel blobs by project and the COPY data"""
+
+    def __init__(self):
+        self.blobs = {}
+        self.row = None
+        # (command, data) of every COPY
+        self.copies = []
+        self.closed = False
+
+    def cursor(self):
+        return self
+
+    def execute(self, command, args=None):
+        if command.startswith('INSERT INTO PlacePackedPixels'):
+            name, data = args
+            self.blobs[name] = bytes(getattr(data, 'adapted', data))
+        elif command.startswith('SELECT substring'):
+            # substring counts from 1, like in postgres
+            start, length, name = args
+            blob = self.blobs.get(name)
+            self.row = None if blob is None else (blob[start - 1:start - 1 + length],)
+
+    def fetchone(self):
+        return self.row
+
+    def copy_expert(self, command, file):
+        self.copies.append((command, file.read()))
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+@pytest.fixture
+def database(monkeypatch, tmp_path):
+    psycopg2 = pytest.importorskip('psycopg2')
+    pytest.importorskip('discord')
+    # util and database read their configs when they are imported, the templates do
+    (tmp_path / 'configs').mkdir()
+    for name in ('database', 'discord'):
+        shutil.copy(os.path.join(ROOT, 'configs', f'{name}_template.json'), tmp_path / 'configs' / f'{name}.json')
+    monkeypatch.chdir(tmp_path)
+
+    connection = FakeConnection()
+    monkeypatch.setattr(psycopg2, 'connect', lambda **kwargs: connection)
+    monkeypatch.delitem(sys.modules, 'database', raising=False)
+    import database
+    monkeypatch.setattr(database, 'connect', lambda: connection)
+    return database
@@ -0,0 +1,114 @@
+import random
+
+import pytest
+
+from amazons.game import *
+from amazons.agents import Terror
+
+
+# only its list move generator is used
+agent = Terror('T', lambda d: 1/d, 0)
+
+
+def list_moves(board, own):
+    """Every full move of own found with the list generator the agents use"""
+    moves = set()
+    for y in range(len(board)):
+        for x in range(len(board)):
+            if board[y][x] != own:
+                continue
+            for to in agent.neighbors(board, (y, x)):
+                record = apply(board, ((y, x), to))
+                for arrow in agent.neighbors(board, to):
+                    moves.add(((y, x), to, arrow))
+                undo(board, record)
+    return moves
+
+
+@pytest.mark.parametrize('plies', [0, 5, 20, 40, 60])
+def test_moves_match_list_generator(random_board, plies):
+    for seed in range(3):
+        board, own = random_board(plies, seed)
+        position = BitBoard.from_board(board)
+        for color in (Piece.white_amazon, Piece.black_amazon):
+            moves = list(position.moves(color))
+            assert len(moves) == len(set(moves))
+            assert set(moves) == list_moves(board, color)
+
+
+@pytest.mark.parametrize('size', [4, 6])
+def test_moves_on_small_boards(random_board, size):
+    for seed in range(5):
+        board, own = random_board(4, seed, size)
+        assert set(BitBoard.from_board(board).moves(own)) == list_moves(board, own)
+
+
+def test_queen_targets_match_rays(random_board):
+    board, own = random_board(30, 1)
+    position = BitBoard.from_board(board)
+    for y in range(10):
+        for x in range(10):
+            assert sorted(position.queen_moves(y, x)) == sorted(agent.neighbors(board, (y, x)))
+
+
+def test_board_round_trip(random_board):
+    board, own = random_board(25, 2)
+    assert BitBoard.from_board(board).to_board() == board
+
+
+def test_play_matches_apply(random_board):
+    rand = random.Random(3)
+    board, own = random_board(10, 3)
+    position = BitBoard.from_board(board)
+    for _ in range(30):
+        move = position.random_move(own, rand)
+        if move is None:
+            break
+        assert apply(board, move) is not None
+        position = position.play(move)
+        assert position == BitBoard.from_board(board)
+        assert position.can_move(own) == Mobility(board).can_move(own)
+        own = Piece.black_amazon if own == Piece.white_amazon else Piece.white_amazon
+
+
+def same_mobility(mobility, board):
+    rebuilt = Mobility(board)
+    return mobility.amazons == rebuilt.amazons and mobility.movable == rebuilt.movable
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_game_keeps_mobility_up_to_date(seed):
+    rand = random.Random(seed)
+    game = Game()
+    own = Piece.white_amazon
+    while not game.finished:
+        move = BitBoard.from_board(game.board).random_move(own, rand)
+        state, _ = game.move(move)
+        assert state in (MoveState.accepted, MoveState.game_over)
+        assert same_mobility(game.mobility, game.board)
+        own = Piece.black_amazon if own == Piece.white_amazon else Piece.white_amazon
+    # the side to move is out of moves exactly when the game is over
+    assert not BitBoard.from_board(game.board).can_move(own)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_search_play_and_take_back_keep_mobility_up_to_date(random_board, seed):
+    from amazons.agents import AlphaTerror
+    rand = random.Random(seed)
+    board, own = random_board(rand.randrange(40), seed)
+    original = [row[:] for row in board]
+    agent = AlphaTerror('A', lambda d: 1/d, 0, 2, 2)
+    agent.mobility = Mobility(board)
+
+    records = []
+    for _ in range(30):
+        move = BitBoard.from_board(board).random_move(own, rand)
+        if move is None:
+            break
+        records.append(agent.play(board, move))
+        assert same_mobility(agent.mobility, board)
+        own = Piece.black_amazon if own == Piece.white_amazon else Piece.white_amazon
+    while records:
+        agent.take_back(board, records.pop())
+        assert same_mobility(agent.mobility, board)
+    assert board == original
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from amazons.game import *
+from amazons import book
+
+
+def image(board, symmetry):
+    """The board seen under a symmetry, every piece moved by book.transform"""
+    size = len(board)
+    result = [[Piece.nothing for _ in range(size)] for _ in range(size)]
+    for y in range(size):
+        for x in range(size):
+            new_y, new_x = book.transform((y, x), symmetry, size)
+            result[new_y][new_x] = board[y][x]
+    return result
+
+
+@pytest.mark.parametrize('size', [6, 10])
+def test_inverse_transform_round_trips(size):
+    for symmetry in range(8):
+        images = set()
+        for y in range(size):
+            for x in range(size):
+                moved = book.transform((y, x), symmetry, size)
+                assert book.inverse_transform(moved, symmetry, size) == (y, x)
+                assert book.transform(book.inverse_transform((y, x), symmetry, size), symmetry, size) == (y, x)
+                images.add(moved)
+        # every symmetry is a permutation of the squares
+        assert len(images) == size * size
+
+
+def test_transform_matches_canonical_image(random_board):
+    board, own = random_board(9, 4)
+    squares = np.frombuffer(pack_board(board), dtype=np.uint8).reshape(10, 10)
+    key, symmetry = book.canonical(board, own)
+    canonical = np.frombuffer(pack_board(image(board, symmetry)), dtype=np.uint8).reshape(10, 10)
+    for y in range(10):
+        for x in range(10):
+            assert canonical[book.transform((y, x), symmetry, 10)] == squares[y, x]
+
+
+def test_symmetric_positions_share_a_key(random_board):
+    board, own = random_board(7, 5)
+    key, _ = book.canonical(board, own)
+    for symmetry in range(8):
+        assert book.canonical(image(board, symmetry), own)[0] == key
+    assert book.canonical(board, Piece.black_amazon if own == Piece.white_amazon else Piece.white_amazon)[0] != key
+
+
+def test_lookup_maps_moves_back(random_board, tmp_path):
+    board, own = random_board(6, 6)
+    move = next(BitBoard.from_board(board).moves(own))
+    key, symmetry = book.canonical(board, own)
+    stored = tuple(book.transform(square, symmetry, 10) for square in move)
+    book.OpeningBook.from_moves(10, {key: (stored, 1.5)}).write(tmp_path / 'book.bin')
+
+    opening_book = book.OpeningBook.load(tmp_path / 'book.bin')
+    assert opening_book.lookup(board, own) == (move, 1.5)
+    for symmetry in range(8):
+        seen = image(board, symmetry)
+        found, value = opening_book.lookup(seen, own)
+        assert found == tuple(book.transform(square, symmetry, 10) for square in move)
+        assert apply(seen, found) is not None
+    assert opening_book.hits == 9
@@ -0,0 +1,76 @@
+import random
+from functools import lru_cache
+
+import pytest
+
+from amazons.game import *
+from amazons.agents import other_color
+from amazons import endgame
+
+
+@lru_cache(maxsize=None)
+def longest(position, own):
+    """Most moves own can play in a row, trying every move"""
+    return max((1 + longest(position.play(move), own) for move in position.moves(own)), default=0)
+
+
+def separated_boards(size, count, seed):
+    """Random boards where walls of arrows keep one white and one black amazon apart"""
+    rand = random.Random(seed)
+    boards = []
+    while len(boards) < count:
+        board = [[Piece.arrow if rand.random() < 0.45 else Piece.nothing for _ in range(size)] for _ in range(size)]
+        empty = [(y, x) for y in range(size) for x in range(size) if board[y][x] == Piece.nothing]
+        if len(empty) < 2:
+            continue
+        (y1, x1), (y2, x2) = rand.sample(empty, 2)
+        board[y1][x1] = Piece.white_amazon
+        board[y2][x2] = Piece.black_amazon
+        split = endgame.regions(board)
+        if all(region.kind != 'contested' for region in split):
+            boards.append(board)
+    return boards
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_solve_matches_brute_force(seed):
+    for board in separated_boards(5, 10, seed):
+        position = BitBoard.from_board(board)
+        for own in (Piece.white_amazon, Piece.black_amazon):
+            move, own_moves, other_moves = endgame.solve(board, own, limit=25)
+            assert own_moves == longest(position, own)
+            assert other_moves == longest(position, other_color(own))
+            if own_moves == 0:
+                assert move is None
+            else:
+                # the move is legal and keeps every other move
+                assert move in set(position.moves(own))
+                assert longest(position.play(move), own) == own_moves - 1
+
+
+def test_fill_with_two_amazons():
+    board = [[Piece.arrow for _ in range(6)] for _ in range(6)]
+    for y, x in [(1, 1), (1, 2), (1, 3), (2, 1), (2, 3), (3, 3)]:
+        board[y][x] = Piece.nothing
+    board[2][2] = board[3][1] = Piece.white_amazon
+    board[5][5] = Piece.black_amazon
+    [region] = [region for region in endgame.regions(board) if region.kind == 'owned' and region.owner == Piece.white_amazon]
+    count, move = endgame.fill(region, Piece.white_amazon)
+    position = BitBoard.from_board(board)
+    assert count == longest(position, Piece.white_amazon)
+    assert longest(position.play(move), Piece.white_amazon) == count - 1
+
+
+def test_contested_and_large_positions_are_not_solved(random_board):
+    board, own = random_board(4, 0)
+    assert endgame.solve(board, own) is None
+
+    board = [[Piece.nothing for _ in range(6)] for _ in range(6)]
+    board[0][0] = Piece.white_amazon
+    board[5][5] = Piece.arrow
+    for y in range(6):
+        board[y][3] = Piece.arrow
+    board[0][5] = Piece.black_amazon
+    # white's side has 17 empty squares, black's 10
+    assert endgame.solve(board, Piece.white_amazon, limit=17) is not None
+    assert endgame.solve(board, Piece.white_amazon, limit=16) is None
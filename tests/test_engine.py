@@ -0,0 +1,217 @@
+import asyncio
+import os
+import random
+import re
+import time
+
+import pytest
+
+from amazons.game import *
+from amazons import engine
+
+ENGINE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      'amazons', 'amazons_rust', 'target', 'debug', 'amazons_rust')
+MOVE = re.compile(r'\((\d+),(\d+)\) \((\d+),(\d+)\) \((\d+),(\d+)\) My evaluation of this is (\S+)')
+
+
+def parse_move(line):
+    """Reads a move line back into a move of (y, x) squares"""
+    match = MOVE.match(line)
+    assert match is not None, line
+    x1, y1, x2, y2, x3, y3 = (int(c) for c in match.groups()[:6])
+    return (y1, x1), (y2, x2), (y3, x3)
+
+
+def board_data(board):
+    return [[piece.value for piece in row] for row in board]
+
+
+@pytest.mark.skipif(not os.path.exists(ENGINE), reason='the Rust engine is not built')
+def test_rust_engine_serves_many_moves():
+    async def play():
+        worker = engine.EngineWorker([ENGINE, '--serve'], timeout=120, retries=0)
+        board = Game().board
+        own = Player.white
+        try:
+            for _ in range(4):
+                line = await worker.select_move(own.value, board_data(board), max_count=200)
+                assert apply(board, parse_move(line)) is not None
+                own = Player.black if own == Player.white else Player.white
+            return worker.restarts, worker.running
+        finally:
+            await worker.stop()
+
+    # every move came from the one process started for the first
+    assert asyncio.run(play()) == (0, True)
+
+
+def test_fallback_answers_when_the_engine_is_missing():
+    async def fallback(game_id, turn, board_data, deadline):
+        board = engine.board_from_data(board_data)
+        return engine.format_move(BitBoard.from_board(board).random_move(engine.own_piece(turn), random.Random(0)), 0)
+
+    async def play():
+        worker = engine.EngineWorker(['/nonexistent/amazons_engine', '--serve'], fallback, retries=1)
+        line = await worker.select_move(Player.white.value, board_data(Game().board))
+        return worker.restarts, line
+
+    restarts, line = asyncio.run(play())
+    assert restarts == 2
+    assert apply(Game().board, parse_move(line)) is not None
+
+
+class Sleeper(Agent):
+    """Takes its time for a random move, its evaluation is when it searched"""
+
+    def select_move(self, board, own):
+        start = time.time()
+        time.sleep(0.3)
+        move, _ = super().select_move(board, own)
+        return move, (start, time.time())
+
+
+def overlap(first, second):
+    return first[0] < second[1] and second[0] < first[1]
+
+
+def run_service(play, workers=2, max_jobs=16):
+    async def main():
+        service = engine.MoveService({'sleeper': Sleeper('sleeper')}, workers=workers, max_jobs=max_jobs)
+        service.start()
+        try:
+            return await play(service)
+        finally:
+            await service.shutdown()
+    return asyncio.run(main())
+
+
+def test_jobs_of_a_game_run_one_after_another():
+    async def play(service):
+        board = Game().board
+        jobs = [service.compute(game_id, 'sleeper', board, Piece.white_amazon) for game_id in ('a', 'a', 'b')]
+        results = await asyncio.gather(*jobs)
+        assert service.locks == {} and service.pending == {}
+        return [evaluation for move, evaluation, stats in results]
+
+    first, second, other = run_service(play)
+    assert not overlap(first, second)
+    assert overlap(first, other) or overlap(second, other)
+
+
+def test_too_many_jobs_make_the_service_busy():
+    async def play(service):
+        board = Game().board
+        jobs = [asyncio.create_task(service.compute(i, 'sleeper', board, Piece.white_amazon)) for i in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(engine.ServiceBusy):
+            await service.compute(2, 'sleeper', board, Piece.white_amazon)
+        await asyncio.gather(*jobs)
+        # with the jobs done there is room again
+        await service.compute(3, 'sleeper', board, Piece.white_amazon)
+
+    run_service(play, max_jobs=2)
+
+
+def test_cancelled_games_fail_their_jobs_and_free_their_lock():
+    async def play(service):
+        board = Game().board
+        jobs = [asyncio.create_task(service.compute('a', 'sleeper', board, Piece.white_amazon)) for _ in range(2)]
+        other = asyncio.create_task(service.compute('b', 'sleeper', board, Piece.white_amazon))
+        await asyncio.sleep(0.1)
+        service.cancel_game('a')
+        # the first search is still running and keeps the game's lock
+        assert service.locks['a'].locked()
+        for job in jobs:
+            with pytest.raises(engine.GameCancelled):
+                await job
+        assert 'a' not in service.pending
+        await other
+
+        # the search already running finishes in its worker before the lock goes
+        await service.queue.join()
+        assert service.locks == {} and service.pending == {}
+        # the game can ask again afterwards
+        move, evaluation, stats = await service.compute('a', 'sleeper', board, Piece.white_amazon)
+        assert apply(board, move) is not None
+
+    run_service(play)
+
+
+def phase_board(empty):
+    """Board data with empty of its 100 squares free"""
+    squares = [Piece.nothing.value] * empty + [Piece.arrow.value] * (100 - empty)
+    return [squares[i:i + 10] for i in range(0, 100, 10)]
+
+
+@pytest.mark.parametrize('empty, weight', [(92, 1.0), (81, 1.0), (80, 1.5), (60, 1.5), (40, 1.0), (26, 1.0),
+                                           (25, 0.5), (5, 0.5), (0, 0.5)])
+def test_phase_weight(empty, weight):
+    assert engine.GameScheduler.phase_weight(phase_board(empty)) == weight
+
+
+def test_shares_follow_the_phase_weights():
+    scheduler = engine.GameScheduler(slots=1, nodes_per_move=1000, seconds_per_move=10.0)
+    scheduler.update('opening', phase_board(90))
+    assert scheduler.share('opening') == 1.0
+    scheduler.update('middle', phase_board(60))
+    scheduler.update('end', phase_board(10))
+    assert scheduler.share('opening') == pytest.approx(1.0 / 3)
+    assert scheduler.share('middle') == pytest.approx(0.5)
+    assert scheduler.share('end') == pytest.approx(0.5 / 3)
+    assert scheduler.budget('middle') == (500, pytest.approx(5.0))
+    # a game the scheduler doesn't know gets the whole budget
+    assert scheduler.share('unknown') == 1.0
+
+    scheduler.finish('opening')
+    assert scheduler.share('middle') == pytest.approx(0.75)
+
+
+def test_shares_stay_between_min_share_and_one():
+    scheduler = engine.GameScheduler(slots=4, min_share=0.1)
+    scheduler.update('a', phase_board(60))
+    scheduler.update('b', phase_board(60))
+    # four slots for two games, but no move gets more than a full budget
+    assert scheduler.share('a') == 1.0
+    for i in range(50):
+        scheduler.update(i, phase_board(60))
+    assert scheduler.share('a') == 0.1
+
+
+def test_idle_games_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(engine.time, 'monotonic', lambda: now[0])
+    scheduler = engine.GameScheduler(idle_timeout=60)
+    scheduler.update('old', phase_board(60))
+    now[0] += 30
+    scheduler.update('new', phase_board(60))
+    assert set(scheduler.games) == {'old', 'new'}
+    now[0] += 31
+    scheduler.update('new', phase_board(60))
+    assert set(scheduler.games) == {'new'}
+
+
+def test_run_waits_for_a_slot():
+    scheduler = engine.GameScheduler(slots=2, nodes_per_move=1000, seconds_per_move=10.0)
+    running = []
+    most = []
+    budgets = []
+
+    async def compute(max_count, deadline):
+        running.append(1)
+        most.append(len(running))
+        budgets.append((max_count, deadline - time.monotonic()))
+        await asyncio.sleep(0.05)
+        running.pop()
+        return max_count
+
+    async def main():
+        return await asyncio.gather(*[scheduler.run(game_id, phase_board(60), compute) for game_id in range(5)])
+
+    results = asyncio.run(main())
+    assert max(most) == 2
+    assert scheduler.moves == 5 and scheduler.running == 0 and scheduler.waiting == 0
+    # the first moves were asked for before the other games were known
+    assert results[0] == 1000
+    assert results[-1] == 400
+    assert all(0 < seconds <= 10.0 for _, seconds in budgets)
+    assert scheduler.max_wait > 0
@@ -0,0 +1,49 @@
+import random
+
+import pytest
+
+from amazons.game import *
+from amazons.agents import Terror, IncrementalEvaluator, other_color
+
+
+def make_agent(backend):
+    return Terror('T', lambda d: 1/min(d, 3), -0.2, backend=backend)
+
+
+@pytest.mark.parametrize('max_region', [0.0, 0.5, 1.0])
+def test_moves_match_full_evaluation(random_board, max_region):
+    python, numpy = make_agent('python'), make_agent('numpy')
+    for seed in range(3):
+        rand = random.Random(seed)
+        board, own = random_board(rand.randrange(30), seed)
+        evaluator = IncrementalEvaluator(python, board, max_region)
+        played = 0
+        for _ in range(25):
+            move = BitBoard.from_board(board).random_move(own, rand)
+            if move is None:
+                break
+            assert evaluator.apply(move) is not None
+            played += 1
+            for color in (Piece.white_amazon, Piece.black_amazon):
+                assert evaluator.value(color) == pytest.approx(python.evaluate_python(board, color))
+                assert evaluator.value(color) == pytest.approx(numpy.evaluate_numpy(board, color))
+            own = other_color(own)
+
+        # taking everything back restores the evaluations on the way
+        for _ in range(played):
+            evaluator.undo()
+            assert evaluator.value(own) == pytest.approx(python.evaluate_python(board, own))
+
+
+def test_queen_moves_and_arrows_match_full_evaluation(random_board):
+    agent = make_agent('python')
+    rand = random.Random(7)
+    board, own = random_board(12, 7)
+    evaluator = IncrementalEvaluator(agent, board)
+    for _ in range(10):
+        (move_from, move_to, arrow_to) = BitBoard.from_board(board).random_move(own, rand)
+        evaluator.apply((move_from, move_to))
+        assert evaluator.value(own) == pytest.approx(agent.evaluate_python(board, own))
+        evaluator.apply_arrow((move_to, arrow_to))
+        assert evaluator.value(own) == pytest.approx(agent.evaluate_python(board, own))
+        own = other_color(own)
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+
+def random_pixels(count, seed=0):
+    rand = np.random.default_rng(seed)
+    xs = rand.integers(0, 0x10000, count)
+    ys = rand.integers(0, 0x10000, count)
+    colors = rand.integers(0, 0x1000000, count)
+    return xs, ys, colors
+
+
+def test_pack_pixels_round_trips(database):
+    xs, ys, colors = random_pixels(1000)
+    data = database.pack_pixels(xs, ys, colors)
+    assert len(data) == 1000 * database.PIXEL.itemsize == 7000
+
+    pixels = np.frombuffer(data, dtype=database.PIXEL)
+    assert (pixels['x'] == xs).all()
+    assert (pixels['y'] == ys).all()
+    assert ((pixels['r'].astype(int) << 16 | pixels['g'].astype(int) << 8 | pixels['b']) == colors).all()
+
+
+def test_read_packed_slices(database):
+    xs, ys, colors = random_pixels(100, 1)
+    data = database.pack_pixels(xs, ys, colors)
+    project = database.PlaceProject('packed', 100, 0, 1)
+    project.insert_packed(data)
+    assert project.packed
+
+    pixels = np.frombuffer(data, dtype=database.PIXEL)
+    for start, count in [(0, 100), (0, 1), (37, 20), (99, 5), (100, 3), (0, 0)]:
+        assert project.read_packed(start, count).tobytes() == pixels[start:start + count].tobytes()
+    assert len(database.PlaceProject('missing', 0, 0, 1).read_packed(0, 10)) == 0
+
+
+def test_claim_packed_follows_the_cursor(database):
+    xs = np.array([0, 1, 65535, 7])
+    ys = np.array([3, 65535, 0, 7])
+    colors = np.array([0x000000, 0xff0000, 0x0a0b0c, 0xffffff])
+    project = database.PlaceProject('claimed', 4, 0, 1)
+    project.insert_packed(database.pack_pixels(xs, ys, colors))
+
+    first = database.PlacePixel.claim_packed(project, 2)
+    assert [(p.x, p.y, p.color, p.seq) for p in first] == [(0, 3, '#000000', 0), (1, 65535, '#ff0000', 1)]
+    rest = database.PlacePixel.claim_packed(project, 10, first[-1].seq)
+    assert [(p.x, p.y, p.color, p.seq) for p in rest] == [(65535, 0, '#0a0b0c', 2), (7, 7, '#ffffff', 3)]
+    assert all(p.id is None and p.project == 'claimed' for p in rest)
+    assert database.PlacePixel.claim_packed(project, 10, rest[-1].seq) == []
+
+
+def copy_fields(line):
+    """Splits a row of COPY's text format and undoes its escapes"""
+    escapes = {'t': '\t', 'n': '\n', 'r': '\r', '\\': '\\'}
+    fields = []
+    for field in line.split('\t'):
+        value, i = '', 0
+        while i < len(field):
+            if field[i] == '\\':
+                value += escapes[field[i + 1]]
+                i += 2
+            else:
+                value += field[i]
+                i += 1
+        fields.append(value)
+    return fields
+
+
+def test_copy_pixels_escapes_rows_and_reports_chunks(database):
+    name = 'tab\there\\back\nline\rend'
+    xs = np.array([3, 1, 4, 1, 5])
+    ys = np.array([9, 2, 6, 5, 3])
+    colors = np.array(['#000000', '#ff0000', '#00ff00', '#0000ff', '#ffffff'])
+    progress = []
+    database.PlacePixel.copy_pixels(name, xs, ys, colors, chunk_size=2, progress=lambda done, total: progress.append((done, total)))
+
+    assert progress == [(2, 5), (4, 5), (5, 5)]
+    copies = database.conn.copies
+    assert [command for command, _ in copies] == ['COPY PlacePixels(project, x, y, color, seq) FROM STDIN'] * 3
+    data = b''.join(rows for _, rows in copies).decode('utf-8')
+    assert data.endswith('\n')
+    lines = data[:-1].split('\n')
+    # the name's tab and newline are escaped, so every row is one line of five fields
+    assert [copy_fields(line) for line in lines] == [[name, str(x), str(y), color, str(seq)]
+                                                    for seq, (x, y, color) in enumerate(zip(xs, ys, colors))]
+    assert lines[0].split('\t')[0] == 'tab\\there\\\\back\\nline\\rend'
+    assert database.conn.closed
+
+
+def test_copy_pixels_takes_byte_colors(database):
+    database.PlacePixel.copy_pixels('p', np.array([7]), np.array([8]), np.array([b'#0a0b0c']))
+    assert database.conn.copies[0][1] == b'p\t7\t8\t#0a0b0c\t0\n'
@@ -0,0 +1,215 @@
+import asyncio
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+
+class Channel:
+    def __init__(self):
+        self.messages = []
+
+    async def send(self, message):
+        self.messages.append(message)
+
+
+class Projects:
+    """The PlaceProjects and PlacePixels tables, record_placed fails while failing is set"""
+
+    def __init__(self, database):
+        self.database = database
+        self.projects = {}
+        self.rows = {}
+        self.failing = False
+
+    def add_rows(self, name, count):
+        self.projects[name] = self.database.PlaceProject(name, count, 0)
+        self.rows[name] = [self.database.PlacePixel(seq + 100, name, seq, 0, '#000000', seq) for seq in range(count)]
+
+    def add_packed(self, name, count):
+        project = self.database.PlaceProject(name, count, 0)
+        project.insert_packed(self.database.pack_pixels(np.arange(count), np.zeros(count, dtype=int), np.zeros(count, dtype=int)))
+
+    def insert_packed(self, insert_packed):
+        """Wraps PlaceProject.insert_packed to keep the project in the table"""
+        def insert(project, data):
+            insert_packed(project, data)
+            self.projects[project.name] = project
+        return insert
+
+    def get_all(self):
+        return [self.database.PlaceProject(p.name, p.total, p.placed, p.priority, p.packed) for p in self.projects.values()]
+
+    def claim(self, name, count, after=-1):
+        return [pixel for pixel in self.rows.get(name, []) if pixel.seq > after][:count]
+
+    def record_placed(self, placed, pixel_ids):
+        if self.failing:
+            raise self.database.psycopg2.OperationalError('server closed the connection unexpectedly')
+        for name in self.rows:
+            self.rows[name] = [pixel for pixel in self.rows[name] if pixel.id not in pixel_ids]
+        for name, count in placed.items():
+            project = self.projects[name]
+            project.placed += count
+            if project.placed >= project.total:
+                del self.projects[name]
+                self.rows.pop(name, None)
+
+
+@pytest.fixture
+def place(database, monkeypatch):
+    pytest.importorskip('PIL')
+    monkeypatch.delitem(sys.modules, 'cogs.place', raising=False)
+    import cogs.place
+    projects = Projects(database)
+    monkeypatch.setattr(database.PlaceProject, 'get_all', projects.get_all)
+    monkeypatch.setattr(database.PlaceProject, 'record_placed', projects.record_placed)
+    monkeypatch.setattr(database.PlacePixel, 'claim', projects.claim)
+    monkeypatch.setattr(database.PlaceProject, 'insert_packed', projects.insert_packed(database.PlaceProject.insert_packed))
+
+    cog = cogs.place.PlaceCog(None)
+    cog.channel = Channel()
+    cog.rate = 3
+    return cog, projects
+
+
+def placed_xs(channel):
+    return [int(message.split()[2]) for message in channel.messages]
+
+
+@pytest.mark.parametrize('storage', ['rows', 'packed'])
+def test_failed_write_back_and_restart_skip_nothing(place, storage):
+    cog, projects = place
+    if storage == 'rows':
+        projects.add_rows('p', 10)
+    else:
+        projects.add_packed('p', 10)
+
+    async def tick():
+        await cog.place_pixel()
+
+    async def run():
+        await tick()
+        # the database goes away during the second tick, which stops the loop
+        projects.failing = True
+        with pytest.raises(Exception):
+            await tick()
+        with pytest.raises(Exception):
+            await cog.place_pixel_stopped()
+        projects.failing = False
+
+        # started again, the unwritten tick is placed again and everything after it once
+        while 'p' in projects.projects:
+            before = len(cog.channel.messages)
+            await tick()
+            assert len(cog.channel.messages) > before
+            if 'p' in projects.projects:
+                # the written back progress never runs ahead of the pixels placed
+                assert projects.projects['p'].placed == len(set(placed_xs(cog.channel)))
+
+    asyncio.run(run())
+    assert placed_xs(cog.channel) == [0, 1, 2, 3, 4, 5, 3, 4, 5, 6, 7, 8, 9]
+    assert cog.placed == {} and cog.sent == []
+
+
+
+class Message:
+    async def edit(self, **kwargs):
+        pass
+
+    async def delete(self):
+        pass
+
+
+class Attachment:
+    def __init__(self, image):
+        self.image = image
+
+    async def save(self, path):
+        self.image.save(path)
+
+
+class Context:
+    """What place_project_add uses of a command context"""
+
+    def __init__(self, image):
+        self.author = SimpleNamespace(avatar=SimpleNamespace(url='https://example.com/avatar.png'))
+        self.message = SimpleNamespace(attachments=[Attachment(image)])
+
+    async def send(self, **kwargs):
+        return Message()
+
+
+def test_new_project_under_an_old_name_starts_from_its_first_pixel(place, monkeypatch, tmp_path):
+    from PIL import Image
+    import cogs.place
+    cog, projects = place
+    cog.storage = 'packed'
+    monkeypatch.setattr(cogs.place.util, 'send_embed', lambda ctx, embed: asyncio.sleep(0))
+    (tmp_path / 'data').mkdir()
+    projects.add_packed('p', 3)
+
+    async def run():
+        await cog.place_pixel()
+        assert 'p' not in projects.projects
+        # the same name again, drawn from x = 10 on
+        image = Image.new('RGBA', (4, 1), (255, 0, 0, 255))
+        await cog.place_project_add.callback(cog, Context(image), 'p', 10, 0, 'id')
+        await cog.place_pixel()
+        await cog.place_pixel()
+
+    asyncio.run(run())
+    assert placed_xs(cog.channel) == [0, 1, 2, 10, 11, 12, 13]
+
+
+def baseline_orders():
+    """The sort keys place project add used on (x, y, rgba) tuples before the orders were lexsort keys.
+
+    fill-grid divided with floats there, whose rounding made most of its ties
+    strict. It is kept here with exact fractions, the order ORDERS reproduces.
+    """
+    from fractions import Fraction
+
+    def grid(p):
+        return min(p[0] % 10, p[1] % 10)
+
+    return {
+        'id': lambda p: p,
+        'mod': grid,
+        'grid': grid,
+        'color': lambda p: p[2],
+        'fill-grid': lambda p: (grid(p) if grid(p) < 4 else 10,
+                                (Fraction(p[0], 10) % 3, Fraction(p[1], 10) % 3),
+                                (Fraction(p[0], 10), Fraction(p[1], 10)), grid(p)),
+    }
+
+
+@pytest.fixture
+def image():
+    rand = np.random.default_rng(0)
+    image = rand.integers(0, 256, (47, 73, 4), dtype=np.uint8)
+    # a few colors only, so the color order has ties, and some transparent pixels
+    image[:, :, :3] = image[:, :, :3] // 64 * 64
+    image[:, :, 3] = np.where(image[:, :, 3] < 40, 0, 255)
+    return image
+
+
+@pytest.mark.parametrize('order', ['id', 'mod', 'grid', 'color', 'fill-grid'])
+def test_orders_match_the_old_sort(place, image, order):
+    import cogs.place
+    pixels = [(x, y, tuple(int(c) for c in image[y, x])) for x in range(image.shape[1]) for y in range(image.shape[0])
+              if image[y, x, 3] >= 255]
+    pixels.sort(key=baseline_orders()[order])
+
+    xs, ys, colors = cogs.place.ordered_pixels(image, order)
+    assert list(zip(xs.tolist(), ys.tolist())) == [(x, y) for x, y, _ in pixels]
+    assert colors.tolist() == [(r << 16) | (g << 8) | b for _, _, (r, g, b, a) in pixels]
+
+
+def test_random_order_keeps_every_pixel(place, image):
+    import cogs.place
+    xs, ys, colors = cogs.place.ordered_pixels(image, 'random')
+    id_xs, id_ys, id_colors = cogs.place.ordered_pixels(image, 'id')
+    assert len(xs) == int((image[:, :, 3] >= 255).sum())
+    assert sorted(zip(xs.tolist(), ys.tolist(), colors.tolist())) == sorted(zip(id_xs.tolist(), id_ys.tolist(), id_colors.tolist()))
@@ -0,0 +1,124 @@
+import random
+import time
+
+import pytest
+
+from amazons.game import *
+from amazons.agents import AlphaTerror, MonteTerror
+
+
+def distance_eval(distance):
+    return 1/min(distance, 3)
+
+
+def legal(board, own, move):
+    return move in set(BitBoard.from_board(board).moves(own))
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_time_limited_search_answers_in_time(random_board, workers):
+    board, own = random_board(6, 0)
+    agent = AlphaTerror('A', distance_eval, -0.2, 6, 2, time_limit=0.5, workers=workers)
+    try:
+        start = time.monotonic()
+        move, evaluation, stats = agent.search(board, own)
+        elapsed = time.monotonic() - start
+    finally:
+        agent.close()
+    assert legal(board, own, move)
+    assert elapsed < 0.5 + 0.5
+    assert agent.depth_reached >= 1
+
+
+def test_deadline_overrides_time_limit(random_board):
+    board, own = random_board(10, 1)
+    agent = AlphaTerror('A', distance_eval, -0.2, 6, 2, time_limit=60)
+    start = time.monotonic()
+    move, evaluation = agent.select_move(board, own, deadline=start + 0.3)
+    assert time.monotonic() - start < 0.3 + 0.5
+    assert legal(board, own, move)
+
+
+@pytest.mark.parametrize('plies', [8, 20])
+def test_parallel_search_finds_the_serial_move(random_board, plies):
+    board, own = random_board(plies, plies)
+    results = []
+    for workers in (1, 2):
+        random.seed(0)
+        agent = AlphaTerror('A', distance_eval, -0.2, 4, 2, time_limit=600, max_depth=3, workers=workers)
+        try:
+            move, evaluation = agent.select_move([row[:] for row in board], own)
+        finally:
+            agent.close()
+        assert agent.depth_reached == 3
+        results.append((move, evaluation))
+    assert results[0][0] == results[1][0]
+    assert results[0][1] == pytest.approx(results[1][1])
+
+
+def other(own):
+    return Piece.black_amazon if own == Piece.white_amazon else Piece.white_amazon
+
+
+def test_monte_tree_is_kept_after_the_opponents_reply(random_board):
+    board, own = random_board(10, 2)
+    agent = MonteTerror('M', distance_eval, -0.2, 4, 2, time_limit=0.5, batch_size=8)
+    move, _ = agent.select_move(board, own)
+    assert legal(board, own, move)
+    apply(board, move)
+
+    # the opponent answers with a reply the search already looked at
+    kept = agent.root
+    reply = max(kept.children, key=lambda child: child.visits)
+    visits = reply.visits
+    assert visits > 0
+    apply(board, reply.move)
+    assert agent.reroot(board, own) is reply
+
+    before = [row[:] for row in board]
+    move, _ = agent.select_move(board, own)
+    assert board == before
+    assert legal(board, own, move)
+    assert reply.visits > visits
+
+
+def test_monte_tree_starts_over_on_unknown_positions(random_board):
+    board, own = random_board(10, 3)
+    agent = MonteTerror('M', distance_eval, -0.2, 4, 2, time_limit=0.2, batch_size=8)
+    agent.select_move(board, own)
+    other_board, other_own = random_board(12, 4)
+    root = agent.reroot(other_board, other_own)
+    assert root.visits == 0 and root.children == []
+
+
+@pytest.mark.parametrize('playout, workers', [('random', 1), ('terror', 1), ('random', 2)])
+def test_monte_moves_are_legal(random_board, playout, workers):
+    board, own = random_board(30, 5)
+    agent = MonteTerror('M', distance_eval, -0.2, 4, 2, time_limit=0.2, playout=playout, batch_size=8, workers=workers)
+    try:
+        for _ in range(6):
+            if not BitBoard.from_board(board).can_move(own):
+                break
+            move, _ = agent.select_move(board, own)
+            assert legal(board, own, move)
+            apply(board, move)
+            own = other(own)
+            reply = BitBoard.from_board(board).random_move(own, random.Random(0))
+            if reply is None:
+                break
+            apply(board, reply)
+            own = other(own)
+    finally:
+        agent.close()
+
+
+def test_playouts_score_finished_games():
+    board = [[Piece.arrow for _ in range(4)] for _ in range(4)]
+    board[0][0] = Piece.white_amazon
+    board[3][3] = Piece.black_amazon
+    board[2][2] = Piece.nothing
+    agent = MonteTerror('M', distance_eval, -0.2, 4, 2)
+    data = pack_board(board)
+    # white is stuck, black can still move
+    assert agent.playouts([(data, Piece.white_amazon)], 0) == [0.0]
+    assert agent.playouts([(data, Piece.black_amazon)], 0) == [0.0]
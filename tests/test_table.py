@@ -0,0 +1,104 @@
+import math
+import random
+
+import pytest
+
+from amazons.game import *
+from amazons.agents import TranspositionTable, AlphaTerror, FreeTerror
+
+
+def small_table(buckets):
+    return TranspositionTable(buckets * 2 * TranspositionTable.ENTRY_BYTES)
+
+
+def test_lookup_needs_the_key_depth_and_context():
+    table = small_table(8)
+    table.store(3, 4, 1.5, 'move', context='wide')
+    assert table.lookup(3, 4, 'wide') == (1.5, 'move')
+    assert table.lookup(3, 2, 'wide') == (1.5, 'move')
+    assert table.lookup(3, 5, 'wide') is None
+    assert table.lookup(3, 4, 'narrow') is None
+    assert table.lookup(11, 4, 'wide') is None
+    assert (table.hits, table.misses, table.stores) == (2, 3, 1)
+
+
+def test_deep_entries_keep_the_first_slot():
+    table = small_table(8)
+    # keys 1, 9 and 17 share a bucket
+    table.store(1, 6, 'deep', None)
+    table.store(9, 2, 'shallow', None)
+    assert table.lookup(1, 6) == ('deep', None)
+    assert table.lookup(9, 2) == ('shallow', None)
+
+    # the second slot always takes the newest entry that doesn't fit the first
+    table.store(17, 3, 'newer', None)
+    assert table.lookup(9, 2) is None
+    assert table.lookup(17, 3) == ('newer', None)
+    assert table.lookup(1, 6) == ('deep', None)
+
+    # an equally deep search replaces the first slot
+    table.store(9, 6, 'as deep', None)
+    assert table.lookup(9, 6) == ('as deep', None)
+    assert table.lookup(1, 6) is None
+
+
+def test_entries_of_earlier_searches_give_way():
+    table = small_table(8)
+    table.store(1, 6, 'deep', None)
+    table.new_search()
+    table.store(9, 1, 'shallow', None)
+    assert table.lookup(9, 1) == ('shallow', None)
+    assert table.lookup(1, 6) is None
+    # in the same search the new entry is preferred again
+    table.store(17, 0, 'shallower', None)
+    assert table.lookup(9, 1) == ('shallow', None)
+    assert table.lookup(17, 0) == ('shallower', None)
+
+
+def test_clear_forgets_everything():
+    table = small_table(8)
+    table.store(1, 1, 0.0, None)
+    table.clear()
+    assert table.lookup(1, 0) is None
+    assert table.stores == 0
+
+
+def negamax(agent, board, own, depth, alpha, beta):
+    agent.mobility = Mobility(board)
+    agent.iteration = depth
+    return agent.negamax(board, own, depth, alpha, beta, math.inf)
+
+
+@pytest.mark.parametrize('plies', [6, 16, 30])
+def test_bounds_in_the_table_keep_negamax_exact(random_board, monkeypatch, plies):
+    board, own = random_board(plies, plies)
+    # generated in a fixed order, moves tied at a cutoff always make the same candidates
+    monkeypatch.setattr(random, 'shuffle', lambda moves: None)
+    exact = negamax(AlphaTerror('A', lambda d: 1/min(d, 3), -0.2, 4, 2), board, own, 3, -math.inf, math.inf)
+
+    # one table through searches with windows below, around and above the value
+    agent = AlphaTerror('A', lambda d: 1/min(d, 3), -0.2, 4, 2)
+    for low, high in [(exact + 1, exact + 2), (exact - 2, exact - 1), (exact - 0.5, exact + 0.5),
+                      (exact + 0.1, exact + 3), (exact - 3, exact - 0.1), (exact - 0.01, exact + 0.01),
+                      (-math.inf, math.inf)]:
+        score = negamax(agent, board, own, 3, low, high)
+        if exact <= low:
+            assert score <= low
+        elif exact >= high:
+            assert score >= high
+        else:
+            assert score == pytest.approx(exact)
+    assert agent.table.hits > 0
+
+
+def test_free_terror_keeps_widths_apart(random_board):
+    board, own = random_board(10, 3)
+    # the root keeps the same width whatever the possibility space, the plies below don't
+    agent = FreeTerror('F', lambda d: 1/min(d, 3), -0.2, 0.5, lambda space, r: 2 if r == 0 else space, 10**6,
+                       table=TranspositionTable())
+    agent.iterations = 0
+    agent.search_move(board, own, 1, 0, 1)
+    agent.search_move(board, own, 3, 0, 1)
+    assert agent.table.hits == 0
+    agent.search_move(board, own, 3, 0, 1)
+    assert agent.table.hits == 1